@@ -8,10 +8,10 @@ The first intent specified for any BagOfBags will always be the default, such as
 an input contains NO recognized words.
 """
 
-import json
+import heapq
 import math
 import string
-import re
+from array import array
 from dataclasses import (
     dataclass
 )
@@ -20,11 +20,16 @@ from typing import (
     Dict,
     Iterable,
     List,
-    Set,
+    Optional,
+    Sequence,
     Tuple
 )
 
+from . import fastjson
+
 _strip = string.punctuation + string.whitespace
+# Posting weights are stored as int16, scaled so each bag's largest weight maps to this
+_QUANT_MAX: int = 32767
 
 @dataclass
 class Document:
@@ -39,8 +44,16 @@ class BagOfBags:
         self.word_indices: Dict[str, int] = {}
         self.intents: List[int] = []
         self.outputs: List[str] = []
+        # Term frequencies of each bag while loading, dropped by finalize once indexed
         self.bags: List[Dict[int, float]] = []
         self.idf: List[float] = []
+        # Postings of all terms laid end to end: term i's (bag, weight) pairs
+        # occupy post_docs/post_weights from post_offsets[i] to post_offsets[i + 1].
+        # Weights are quantized per bag, and bag_scales undoes that quantization
+        self.post_offsets: List[int] = [0]
+        self.post_docs: array = array('l')
+        self.post_weights: array = array('h')
+        self.bag_scales: List[float] = []
     
     #==========Public facing functions meant to be used as is==========
     
@@ -48,7 +61,7 @@ class BagOfBags:
         """Populate this bag of bags with the provided file like containing JSON.
         Does not call .finalize() after, in case you want to run on multiple
         sources, so call that yourself afterwards"""
-        d: Dict[str, List[str]] = json.load(src)
+        d: Dict[str, List[str]] = fastjson.loads(src.read())
         bags: Iterable[Document] = map(lambda x: Document(*x), d.items())
         self.load_docs(bags)
     
@@ -56,62 +69,178 @@ class BagOfBags:
         """Get the best fitting result for an input sentence.
         No need to preprocess it
         Essentially, this is the whole point of a BagOfBags"""
-        words: List[str] = re.split('\\s+', sentence.strip(_strip).lower())
+        return self.process_tokens(BagOfBags.tokenize(sentence))
+    
+    def process_tokens(self, words: Sequence[str]) -> str:
+        """Same as .process(), but for a sentence that is already split into words,
+        such as by the Brain when no pattern matches it. Words are lowercased here"""
+        scores: Optional[List[float]] = self.score(map(str.lower, words))
+        if scores is None:
+            return self.outputs[0]
+        # Only the best match is needed, so find it with max() rather than sorting.
+        # Ties go to the later bag, as they did when this was a reverse sort, which
+        # means the last bag wins when nothing scores above zero
+        best_similarity: float = max(scores)
+        if best_similarity == 0:
+            return self.outputs[self.intents[-1]]
+        # Step through the (usually few) ties without copying the scores to reverse them
+        best_i: int = scores.index(best_similarity)
+        try:
+            while True:
+                best_i = scores.index(best_similarity, best_i + 1)
+        except ValueError:
+            pass
+        return self.outputs[self.intents[best_i]]
+    
+    def process_top(self, sentence: str, k: int) -> List[str]:
+        """Get up to k distinct results for an input sentence, best fitting first.
+        Each result is ranked by its best fitting bag, with ties broken the same way
+        as in .process(), so the first result is always what .process() returns"""
+        scores: Optional[List[float]] = self.score(BagOfBags.tokenize(sentence))
+        if scores is None:
+            return [self.outputs[0]]
+        best: Dict[int, Tuple[float, int]] = {}
+        for i, (similarity, intent) in enumerate(zip(scores, self.intents)):
+            if intent not in best or similarity >= best[intent][0]:
+                best[intent] = (similarity, i)
+        ranked: List[Tuple[Tuple[float, int], int]] =\
+            heapq.nlargest(k, map(lambda x: (x[1], x[0]), best.items()))
+        return [self.outputs[intent] for _, intent in ranked]
+    
+    #==========Functions for inernal use mainly==========
+    
+    @staticmethod
+    def tokenize(sentence: str) -> List[str]:
+        """Split a sentence into lowercase words, ignoring surrounding punctuation"""
+        return sentence.strip(_strip).lower().split()
+    
+    def score(self, words: Iterable[str]) -> Optional[List[float]]:
+        """Score every bag against a tokenized sentence, in the order the bags were loaded.
+        Returns None if the sentence has no recognized words"""
+        words = list(words)
+        if len(words) == 0:
+            return None
         bag_in: Dict[int, float] = {}
+        bag_in_get = bag_in.get
+        word_indices_get = self.word_indices.get
+        idf: List[float] = self.idf
         delta: float = 1 / len(words)
         for word in words:
-            if word not in self.word_indices:
+            index: Optional[int] = word_indices_get(word)
+            if index is None:
                 continue
-            index: int = self.word_indices[word]
-            bag_in[index] = bag_in.get(index, 0) + delta * self.idf[index]
+            bag_in[index] = bag_in_get(index, 0) + delta * idf[index]
         if len(bag_in) == 0:
-            return self.outputs[0]
-        queue: List[Tuple[float, int]] = []
-        for i, bag in enumerate(self.bags):
-            similarity: float = BagOfBags.cosine_similarity_sq(bag_in, bag)
-            queue.append((similarity, i))
-        queue.sort(reverse=True)
-        return self.outputs[self.intents[queue[0][1]]]
-    
-    #==========Functions for inernal use mainly==========
+            return None
+        # Stored bags are already unit length, so the dot product alone ranks them
+        # the same as cosine similarity would. The query's own norm is the same for
+        # every bag, so it is not needed either.
+        # Only bags sharing a word with the query can score above zero, so walk the
+        # postings of the query's words instead of every bag
+        scores: List[float] = [0.0] * len(self.intents)
+        _accumulate(bag_in, self.post_offsets, self.post_docs, self.post_weights,\
+            self.bag_scales, scores)
+        return scores
     
     def load_docs(self, documents: Iterable[Document]) -> None:
         """Load a list of documents to populate this BOW"""
+        word_indices: Dict[str, int] = self.word_indices
+        word_indices_get = word_indices.get
+        idf: List[float] = self.idf
         for doc_i, document in enumerate(documents):
             self.outputs.append(document.sentence)
             for sentence in document.bags:
+                words: List[str] = BagOfBags.tokenize(sentence)
+                if len(words) == 0:
+                    continue
                 self.intents.append(doc_i)
                 freqs: Dict[int, float] = {}
+                freqs_get = freqs.get
                 self.bags.append(freqs)
-                words: List[str] = re.split('\\s+', sentence.strip(_strip).lower())
                 delta: float = 1 / len(words)
-                encountered: Set[str] = set()
                 for word in words:
-                    if word not in self.word_indices:
-                        self.word_indices[word] = len(self.word_indices)
-                        self.idf.append(0)
-                    index: int = self.word_indices[word]
-                    if word not in encountered:
-                        encountered.add(word)
-                        self.idf[index] += 1
-                    freqs[index] = freqs.get(index, 0) + delta
+                    index: Optional[int] = word_indices_get(word)
+                    if index is None:
+                        index = len(word_indices)
+                        word_indices[word] = index
+                        idf.append(0)
+                    # freqs holds exactly the terms already seen in this sentence,
+                    # so a term's first occurrence is when it is not in freqs yet
+                    freq: Optional[float] = freqs_get(index)
+                    if freq is None:
+                        idf[index] += 1
+                        freq = 0
+                    freqs[index] = freq + delta
     
     def finalize(self) -> None:
-        """Calculate the IDFs of each term.
+        """Calculate the IDFs of each term, scale each bag to unit length,
+        and index the bags by the terms they contain.
         Call this once you've loaded all your sources,
-        before you start calling .process()"""
-        for index, freq in enumerate(self.idf):
-            self.idf[index] = math.log(len(self.intents) / freq)
-        for bag in self.bags:
+        before you start calling .process()
+        Only the index is kept afterwards, so nothing more can be loaded"""
+        total: int = len(self.intents)
+        self.idf = [math.log(total / freq) for freq in self.idf]
+        idf: List[float] = self.idf
+        postings: List[List[Tuple[int, int]]] = [[] for _ in idf]
+        self.bag_scales = []
+        # Weight, normalize, and index each bag in a single pass over it
+        for doc, bag in enumerate(self.bags):
+            sq_norm: float = 0.0
+            max_weight: float = 0.0
+            weights: List[Tuple[int, float]] = []
             for index, freq in bag.items():
-                bag[index] *= self.idf[index]
+                weight: float = freq * idf[index]
+                weights.append((index, weight))
+                sq_norm += weight * weight
+                if weight > max_weight:
+                    max_weight = weight
+            norm: float = math.sqrt(sq_norm) or 1.0
+            # Quantizing each bag against its own largest weight keeps its relative
+            # precision, and the scale is applied back to the bag's summed score
+            scale: float = _QUANT_MAX * norm / max_weight if max_weight > 0 else 1.0
+            self.bag_scales.append(1 / scale)
+            for index, weight in weights:
+                postings[index].append((doc, round(weight / norm * scale)))
+        self.post_offsets = [0]
+        self.post_docs = array('l')
+        self.post_weights = array('h')
+        for term_postings in postings:
+            for doc, weight in term_postings:
+                self.post_docs.append(doc)
+                self.post_weights.append(weight)
+            self.post_offsets.append(len(self.post_docs))
+        self.bags = []
     
     @staticmethod
     def cosine_similarity_sq(bag_a: Dict[int, float], bag_b: Dict[int, float]) -> float:
         """Actually returns the square of cosine similarity, which can still be sorted,
         as all elements will be non-negative"""
-        dot_prod: float = sum(map(lambda x: bag_a[x] * bag_b.get(x, 0), bag_a))
-        sq_a: float = sum(map(lambda x: x*x, bag_a.values()))
-        sq_b: float = sum(map(lambda x: x*x, bag_b.values()))
+        # Probe the larger bag with the smaller one's terms
+        small, large = (bag_a, bag_b) if len(bag_a) <= len(bag_b) else (bag_b, bag_a)
+        large_get = large.get
+        dot_prod: float = 0.0
+        for index, value in small.items():
+            other: Optional[float] = large_get(index)
+            if other is not None:
+                dot_prod += value * other
+        sq_a: float = 0.0
+        for value in bag_a.values():
+            sq_a += value * value
+        sq_b: float = 0.0
+        for value in bag_b.values():
+            sq_b += value * value
         return dot_prod * dot_prod / (sq_a * sq_b)
-        
\ No newline at end of file
+        
+
+def _accumulate(query: Dict[int, float],
+        offsets: List[int],
+        docs: Sequence[int],
+        weights: Sequence[int],
+        scales: List[float],
+        out: List[float]) -> None:
+    """Add the query's weight for each term times each of that term's posting weights,
+    dequantized by the bag's scale, into the score of the posting's bag"""
+    for index, value in query.items():
+        for posting in range(offsets[index], offsets[index + 1]):
+            doc: int = docs[posting]
+            out[doc] += value * weights[posting] * scales[doc]
@@ -5,12 +5,16 @@ c Yaakov Schectman 2022
 The Brain is essentially the engine of the AIML bot.
 """
 
-import json
+import functools
 import locale
 import logging
 import re
 import string
 import sys
+from collections import (
+    deque,
+    OrderedDict
+)
 from dataclasses import (
     dataclass,
     field
@@ -24,38 +28,73 @@ from threading import Lock
 from typing import (
     Callable,
     ClassVar,
+    Deque,
     Dict,
+    FrozenSet,
     Iterable,
     List,
     Optional,
-    Set
+    Sequence,
+    Tuple
 )
 from xml.etree import ElementTree as ET
 
 from . import (
-    bow,
     config,
+    fastjson,
     parser,
     pattern,
     translatable
 )
+# Imported under another name, as Brain has a field named bow
+from . import bow as bow_module
+from .substitution import (
+    build_scanner,
+    SubstitutionScanner
+)
 
 _strip: str = '!?."#$%&\'()*+,-/:;<=>@[\\]^_{|}~' + string.whitespace
 _remove: str = '!?."#$%&\'()*+,-/:;<=>@[\\]^_{|}~'
+_REMOVE_TABLE: Dict[int, None] = str.maketrans('', '', _remove)
 _callback: type = Callable[[str, str, str], None]
+# A cached SRAI result, and the stars it left behind if its subquery matched anything
+_srai_result: type = Tuple[str, Optional[Tuple[List[str], List[str], List[str]]]]
+_SENT_RE: re.Pattern = re.compile('[.!?]+ ')
+# The strings int() accepts, short of its digit limit: whitespace other than \x1c-\x1f,
+# an optional sign, and digits optionally grouped by single underscores
+_INT_RE: Callable[[str], Optional[re.Match]] =\
+    re.compile('[^\\S\x1c-\x1f]*[+-]?\\d(?:_?\\d)*[^\\S\x1c-\x1f]*').fullmatch
+# Set, map, bot, and variable names come from a small fixed vocabulary in the templates,
+# so their lowercased forms are worth remembering instead of rebuilding on every lookup
+_lower: Callable[[str], str] = functools.lru_cache(maxsize=1024)(str.lower)
+_EMPTY_MAP: Dict[str, str] = {}
+_EMPTY_SET: FrozenSet[str] = frozenset()
+# The LC_TIME locale last set by get_date, if any
+_time_locale: Optional[str] = None
+_time_locale_lock: Lock = Lock()
+
+@functools.lru_cache(maxsize=256)
+def _tokenize(sentence: str) -> Tuple[str, ...]:
+    """Split a sentence into the words matched against patterns.
+    Cached, since SRAI and repeated input tend to tokenize the same sentences again"""
+    return tuple(sentence.split())
+
 @dataclass
 class Brain(object):
     """The "thinking" part of an AIML bot_name
-    Contains the maps, sets, variables, bot properties, history, and pattern matching"""
+    Contains the maps, sets, variables, bot properties, history, and pattern matching
+    Responses and SRAI results are cached until the predicates or patterns they depend on
+    change, which the Brain only notices through its own methods. After changing bot_vars,
+    user_vars, sets, maps, or substitutions directly, call invalidate_caches()"""
     brain_config: config.BrainConfig = field(default_factory = lambda: None)
     bot_vars: Dict[str, str] = field(default_factory = dict)
     user_vars: Dict[str, str] = field(default_factory = dict)
     substitutions: Dict[str, Dict[str, str]] = field(default_factory = dict)
     maps: Dict[str, Dict[str, str]] = field(default_factory = dict)
-    sets: Dict[str, Set[str]] = field(default_factory = dict)
-    history: Dict[str, List[str]] = field(default_factory =\
-        lambda: {'input': [], 'request': [], 'response': []})
-    that_history: List[List[str]] = field(default_factory = list)
+    sets: Dict[str, FrozenSet[str]] = field(default_factory = dict)
+    history: Dict[str, Deque[str]] = field(default_factory =\
+        lambda: {'input': deque(), 'request': deque(), 'response': deque()})
+    that_history: Deque[List[str]] = field(default_factory = deque)
     stars: List[str] = field(default_factory = list)
     that_stars: List[str] = field(default_factory = list)
     topic_stars: List[str] = field(default_factory = list)
@@ -65,7 +104,21 @@ class Brain(object):
     srai_depth: int = field(init=False, default=0)
     thread_lock: Lock = field(init=False, default_factory = Lock)
     callbacks: Dict[str, List[_callback]] = field(init=False, default_factory=dict)
-    bag: Optional[bow.BagOfBags] = field(init=False, default=None)
+    bow: Optional[bow_module.BagOfBags] = field(init=False, default=None)
+    substitution_automata: Dict[str, SubstitutionScanner] =\
+        field(init=False, default_factory=dict)
+    # SRAI results that involved no side effects, keyed by subquery, last THAT sentence,
+    # state_version, and srai_depth, in least recently used order
+    srai_cache: 'OrderedDict[Tuple[str, Optional[str], int, int], _srai_result]' =\
+        field(init=False, default_factory=OrderedDict)
+    # Rendered templates of input sentences that involved no side effects, keyed the same way
+    # as srai_cache but by the sentence's words, in least recently used order
+    response_cache: 'OrderedDict[Tuple[Tuple[str, ...], Optional[str], int, int], _srai_result]' =\
+        field(init=False, default_factory=OrderedDict)
+    # Bumped whenever predicates or patterns change, so older cached results no longer apply
+    state_version: int = field(init=False, default=0)
+    # Bumped by anything whose result can change between identical calls
+    volatile_count: int = field(init=False, default=0)
     
     #==========The meat and potatoes. The public-facing in/out function==========
     def process(self, request: str) -> str:
@@ -93,17 +146,38 @@ class Brain(object):
             self.callbacks[variable] = []
         self.callbacks[variable].append(callback)
     
+    def invalidate_caches(self) -> None:
+        """Forget every cached response and SRAI result, for after bot_vars, user_vars, sets,
+        maps, or substitutions have been changed without going through the Brain's methods"""
+        self.state_version += 1
+        self.srai_cache.clear()
+        self.response_cache.clear()
+        self.substitution_automata.clear()
+    
     #==========Setup methods to create the Brain==========
     
     def __post_init__(self):
         self.aiml_parser = parser.AimlParser(self.brain_config)
+        self.trim_history()
         self.load_brains()
         self.load_props()
         self.load_learnt_rules()
         self.load_bow()
     
     def load_brains(self) -> None:
-        for brain_name in (self.brain_config.brain_files or ()):
+        brain_files: List[str] = list(self.brain_config.brain_files or ())
+        if self.brain_config.parse_workers > 1 and len(brain_files) > 1:
+            try:
+                loaded_tree: pattern.PatternTree =\
+                    self.aiml_parser.parse_many(brain_files, self.brain_config.parse_workers)
+                self.pattern_tree.merge(loaded_tree)
+                self.state_version += 1
+                return
+            except Exception as e:
+                # Loading them one at a time reports which file could not be loaded
+                print(f'Failed to load brains in parallel, loading them one at a time: {e}',\
+                    file=sys.stderr)
+        for brain_name in brain_files:
             self.load_brain_from_path(brain_name)
     
     def load_brain_from_path(self, path: str) -> None:
@@ -111,6 +185,7 @@ class Brain(object):
         try:
             loaded_tree: pattern.PatternTree = self.aiml_parser.parse(path)
             self.pattern_tree.merge(loaded_tree)
+            self.state_version += 1
         except:
             print(f'Failed to load brain from {path}', file=sys.stderr)
     
@@ -118,17 +193,23 @@ class Brain(object):
         """Load properties from files"""
         if self.brain_config is None:
             return
-        self.bot_vars = Brain.deserialize(self.brain_config.bot_file_path) or {}
-        self.user_vars = Brain.deserialize(self.brain_config.init_vars_file_path) or {}
+        # Everything looked up by name or by key is stored lowercase, so each lookup
+        # only has to lowercase what it is given
+        self.bot_vars = Brain.lower_keys(Brain.deserialize(self.brain_config.bot_file_path) or {})
+        self.user_vars =\
+            Brain.lower_keys(Brain.deserialize(self.brain_config.init_vars_file_path) or {})
         for set_file in (self.brain_config.set_files or ()):
                 self.sets[path.splitext(path.basename(set_file))[0].lower()] =\
-                    set(Brain.deserialize(set_file) or ())
+                    frozenset(sys.intern(item.lower()) for item in\
+                        Brain.deserialize(set_file) or ())
         for map_file in (self.brain_config.map_files or ()):
                 self.maps[path.splitext(path.basename(map_file))[0].lower()] =\
-                    Brain.deserialize(map_file) or {}
+                    Brain.lower_keys(Brain.deserialize(map_file) or {})
         for sub_file in (self.brain_config.sub_files or ()):
                 self.substitutions[path.splitext(path.basename(sub_file))[0].lower()] =\
-                    Brain.deserialize(sub_file) or {}
+                    Brain.lower_keys(Brain.deserialize(sub_file) or {})
+        self.substitution_automata.clear()
+        self.state_version += 1
     
     def load_learnt_rules(self) -> None:
         if self.pattern_tree is None or\
@@ -141,6 +222,7 @@ class Brain(object):
             learnt_tree: pattern.PatternTree =\
                 self.aiml_parser.parse(self.brain_config.learn_file_path)
             self.pattern_tree.merge(learnt_tree)
+            self.state_version += 1
         except:
             print(f'Failed to load learnt rules from {self.brain_config.learn_file_path}',
                 file=sys.stderr)
@@ -149,7 +231,7 @@ class Brain(object):
         if not self.brain_config.bow_file_path:
             return
         try:
-            self.bow = bow.BagOfBags()
+            self.bow = bow_module.BagOfBags()
             with open(self.brain_config.bow_file_path) as file:
                 self.bow.load(file)
             self.bow.finalize()
@@ -187,109 +269,168 @@ class Brain(object):
         if self.brain_config is not None and self.brain_config.max_srai_recursion > 0\
                 and self.brain_config.max_srai_recursion <= self.srai_depth:
             return ''
+        that: Optional[str] = self.that_history[-1][-1]\
+            if len(self.that_history) != 0 and len(self.that_history[-1]) != 0 else None
+        key: Tuple[str, Optional[str], int, int] =\
+            (subquery, that, self.state_version, self.srai_depth)
+        cached: Optional[_srai_result] = self.srai_cache.get(key)
+        if cached is not None:
+            self.srai_cache.move_to_end(key)
+            result, stars = cached
+            if stars is not None:
+                self.stars, self.that_stars, self.topic_stars = stars
+            return result
+        stars_before: List[str] = self.stars
+        volatile_count: int = self.volatile_count
         self.srai_depth += 1
         result: str = self.get_string_for(subquery, False)
         self.srai_depth -= 1
+        if self.volatile_count == volatile_count:
+            self.srai_cache[key] = (result, None if self.stars is stars_before else\
+                (self.stars, self.that_stars, self.topic_stars))
+            if len(self.srai_cache) > Brain._srai_cache_size:
+                self.srai_cache.popitem(last = False)
         return result
     
+    def mark_volatile(self) -> None:
+        """Note that the output being generated has side effects or may not be repeated,
+        so it must not be cached"""
+        self.volatile_count += 1
+    
     def get_in_set(self, set_name: str, key: str) -> bool:
         """Return True if key is in the set named set_name"""
-        set_name: str = set_name.lower()
+        set_name: str = _lower(set_name)
         key: str = key.lower()
-        if set_name in Brain._builtin_sets:
-            res: bool = Brain._builtin_sets[set_name](key)
-            return res
-        return set_name in self.sets and key in self.sets[set_name]
+        builtin: Optional[Callable[[str], bool]] = Brain._builtin_sets.get(set_name)
+        if builtin is not None:
+            return builtin(key)
+        return key in self.sets.get(set_name, _EMPTY_SET)
     
     def get_map(self, map_name: str, key: str) -> str:
         """Return the proper value corresponding to key in map_name
         Return '' if there is no match"""
-        map_name: str = map_name.lower()
+        map_name: str = _lower(map_name)
         key_lower: str = key.lower()
-        if map_name in Brain._builtin_maps:
-            return Brain.match_case(Brain._builtin_maps[map_name](key_lower), key)
-        return '' if (map_name not in self.maps or key_lower not in self.maps[map_name])\
-            else self.maps[map_name][key_lower]
+        builtin: Optional[Callable[[str], str]] = Brain._builtin_maps.get(map_name)
+        if builtin is not None:
+            if map_name == 'python':
+                self.mark_volatile()
+            return Brain.match_case(builtin(key_lower), key)
+        return self.maps.get(map_name, _EMPTY_MAP).get(key_lower, '')
     
     def get_bot(self, bot_name: str) -> str:
         """Get the bot property named bot_name
         Return '' if no bot matters"""
-        return '' if bot_name.lower() not in self.bot_vars else self.bot_vars[bot_name.lower()]
+        return self.bot_vars.get(_lower(bot_name), '')
     
     def get_var(self, var_name: str) -> str:
         """Get the predicate variable named var_name
         Return '' if no variable matches"""
-        return '' if var_name.lower() not in self.user_vars else self.user_vars[var_name.lower()]
+        return self.user_vars.get(_lower(var_name), '')
     
     def get_substitution(self, subst_name: str, value: str) -> str:
         """Perform piece by piece substitution on value with subst_name
         If the substitution name is invalid, return the provided input"""
-        if subst_name.lower() not in self.substitutions:
+        subst_name = _lower(subst_name)
+        substitutions: Optional[Dict[str, str]] = self.substitutions.get(subst_name)
+        if substitutions is None:
             return value
-        substitutions: Dict[str, str] = self.substitutions[subst_name.lower()]
-        build: str = ''
-        remaining: str = value.lower()
-        while len(remaining) > 0:
-            pos: int = len(remaining)
-            match_key: Optional[str] = None
-            for key in substitutions:
-                npos: int = remaining.find(key.lower())
+        if len(substitutions) >= Brain._automaton_threshold:
+            automaton: Optional[SubstitutionScanner] =\
+                self.substitution_automata.get(subst_name)
+            if automaton is None:
+                automaton = build_scanner(substitutions, self.brain_config is not None and\
+                    self.brain_config.use_hyperscan)
+                self.substitution_automata[subst_name] = automaton
+            lowered: str = value.lower()
+            parts: List[str] = []
+            cursor: int = 0
+            for start, end, replacement in automaton.scan(lowered):
+                parts.append(lowered[cursor:start])
+                parts.append(Brain.match_case(replacement, value[start:end]))
+                cursor = end
+            parts.append(lowered[cursor:])
+            return ''.join(parts)
+        # For only a few keys, searching for each one directly is cheaper than
+        # building an automaton. Keys were already lowercased by load_props
+        lowered: str = value.lower()
+        length: int = len(lowered)
+        keys: List[str] = list(substitutions)
+        # Where each key next occurs at or after the cursor, or -1 if it no longer does.
+        # A key only needs searching again once the cursor has passed its position
+        positions: List[int] = [lowered.find(key) for key in keys]
+        parts: List[str] = []
+        cursor: int = 0
+        while cursor < length:
+            pos: int = length
+            match_i: int = -1
+            for i, npos in enumerate(positions):
+                if 0 <= npos < cursor:
+                    npos = lowered.find(keys[i], cursor)
+                    positions[i] = npos
                 if npos != -1 and npos < pos:
                     pos = npos
-                    match_key = key
-                    template: str = value[npos:npos+len(key)]
-            build += remaining[:pos]
-            if match_key is not None:
-                substr: str = remaining[pos : pos + len(match_key)]
-                pos += len(match_key)
-                build += Brain.match_case(substitutions[match_key], template)
-            remaining = remaining[pos:]
-            value = value[pos:]
-        return build
+                    match_i = i
+            parts.append(lowered[cursor:pos])
+            cursor = pos
+            if match_i != -1:
+                match_key: str = keys[match_i]
+                cursor += len(match_key)
+                parts.append(Brain.match_case(substitutions[match_key], value[pos:cursor]))
+        return ''.join(parts)
     
     def get_repeat(self, index: int, repeat_type: str) -> str:
         """Get a history value at index (1 = most recent), and given repeat_type
         If the index is out of bounds for repeat_type, return ''"""
-        if repeat_type.lower() in self.history and index <= len(self.history[repeat_type.lower()]):
-            return self.history[repeat_type.lower()][-index]
+        self.mark_volatile()
+        history: Optional[Deque[str]] = self.history.get(_lower(repeat_type))
+        if history is not None and 1 <= index <= len(history):
+            return history[-index]
         return ''
     
     def get_that(self, index: int, sentence: int) -> str:
         """Get a "that" context result
         If the indices are out of bounds, return ''"""
-        if index <= len(self.that_history) and sentence <= len(self.that_history[-index]):
+        self.mark_volatile()
+        if 1 <= index <= len(self.that_history) and\
+                1 <= sentence <= len(self.that_history[-index]):
             return self.that_history[-index][-sentence]
         return ''
     
     def get_date(self, dformat: str, localet: Optional[str], timezone: Optional[str]) -> str:
         """Get a formatted date"""
-        if localet is not None:
-            locale.setlocale(locale.LC_TIME, localet)
+        self.mark_volatile()
         if timezone is None:
             now = datetime.now()
         else:
             now = datetime.utcnow() - timedelta(hours = timezone)
-        return now.strftime(dformat)
+        # LC_TIME is process-wide, so switching it and formatting must not interleave
+        # with another Brain doing the same
+        with _time_locale_lock:
+            if localet is not None:
+                Brain.set_time_locale(localet)
+            return now.strftime(dformat)
     
     def set_var(self, var_name: str, value: str) -> None:
         """Set a predicate variable"""
-        var_name = var_name.lower()
-        if var_name in self.callbacks:
-            old_val: str = '' if var_name not in self.user_vars else self.user_vars[var_name]
-            for callback in self.callbacks[var_name]:
+        self.state_version += 1
+        self.mark_volatile()
+        var_name = _lower(var_name)
+        callbacks: Optional[List[_callback]] = self.callbacks.get(var_name)
+        if callbacks is not None:
+            old_val: str = self.user_vars.get(var_name, '')
+            for callback in callbacks:
                 callback(var_name, old_val, value)
         self.user_vars[var_name] = value
     
     def get_star(self, index: int, star_type: str) -> str:
         """Get any type of star with a provided index
         If there is no appropriate star at the given index, return ''"""
-        choice: List[str]
-        if star_type.lower() == 'star':
-            choice = self.stars
-        elif star_type.lower() == 'thatstar':
-            choice = self.that_stars
-        else:
-            choice = self.topic_stars
+        return self.get_star_by_type(index, translatable.StarType.of(star_type))
+    
+    def get_star_by_type(self, index: int, star_type: translatable.StarType) -> str:
+        """Same as .get_star(), for a star type already resolved to a StarType"""
+        choice: List[str] = (self.stars, self.that_stars, self.topic_stars)[star_type]
         if len(choice) == 0:
             return ''
         if index - 1 < 0 or index - 1 >= len(choice):
@@ -305,10 +446,12 @@ class Brain(object):
         """Learn a new pattern from the <learn> tag
         Desired spaces will be encoded in the literal segments of the pattern, so I will
         join on the empty string"""
+        self.state_version += 1
+        self.mark_volatile()
         pattern_str: str = ''.join(pattern)
         that_str: str = '' if that is None else ''.join(that)
         topic_str: str = '' if topic is None else ''.join(topic)
-        pattern_toks: List[pattern.PatternToken] = parser.AimlParser.literal_to_pattern(pattern_str)
+        pattern_toks: Sequence[pattern.PatternToken] = parser.AimlParser.literal_to_pattern(pattern_str)
         that_toks = None if topic is None else\
             parser.AimlParser.literal_to_pattern(that_str)
         topic_toks = None if topic is None else\
@@ -324,6 +467,7 @@ class Brain(object):
         dummy: ET.Element = ET.fromstring(xml_str)
         tempelm: ET.Element = ET.SubElement(dummy, 'template')
         template.append_to(tempelm)
+        parser.AimlParser.lowercase_tags(dummy)
         new_pattern: pattern.PatternTree = self.aiml_parser.parse_category(dummy)
         self.pattern_tree.merge(new_pattern)
         
@@ -332,6 +476,8 @@ class Brain(object):
     
     def unlearn(self) -> None:
         """Forget all learned rules"""
+        self.state_version += 1
+        self.mark_volatile()
         self.learned_tree.clear()
     
     #==========Methods used for actual matching to return results==========
@@ -343,58 +489,86 @@ class Brain(object):
         Each sentence will map to one output sentence, joind by periods"""
         if strip:
             self.history['request'].append(provided)
-        sentences: List[str] = re.split('[.!?]+ ', provided.strip())
+        provided = provided.strip()
+        # Most requests are a single sentence. The split pattern can only match where
+        # punctuation is followed by a space, so check for that first without the regex
+        sentences: Sequence[str] = (provided,)
+        if '. ' in provided or '! ' in provided or '? ' in provided:
+            sentences = _SENT_RE.split(provided)
         output: List[str] = []
         that_lst: List[str] = []
+        that: Optional[str] = self.that_history[-1][-1]\
+            if len(self.that_history) != 0 and len(self.that_history[-1]) != 0 else None
         for sentence in sentences:
             if strip:
-                sentence = sentence.translate(str.maketrans('', '', _remove)).strip(_strip)
+                sentence = sentence.translate(_REMOVE_TABLE).strip(_strip)
             if not sentence:
                 continue
             if strip:
-                self.history['input'].append(sentence.split)
-            words = re.split('\\s+', sentence.strip())
-            match: Optional[PatternMatch] = self.pattern_tree.match(words, self)
-            if match is None:
-                if strip and self.bow is not None:
-                    intent: str = self.bow.process(provided)
-                    subquery: str = self.get_string_for(intent, strip=False)
-                    output.append(subquery)
-                # Append None for now. Later I think I will have an intent recognizer
-                else:
-                    output.append(None)
-                continue
+                self.history['input'].append(sentence)
+            words: Tuple[str, ...] = _tokenize(sentence)
+            key: Tuple[Tuple[str, ...], Optional[str], int, int] =\
+                (words, that, self.state_version, self.srai_depth)
+            cached: Optional[_srai_result] = self.response_cache.get(key)
+            if cached is not None:
+                self.response_cache.move_to_end(key)
+                rendered: str = cached[0]
+                self.stars, self.that_stars, self.topic_stars = cached[1]
             else:
+                match: Optional[PatternMatch] = self.pattern_tree.match(words, self)
+                if match is None:
+                    if strip and self.bow is not None:
+                        intent: str = self.bow.process_tokens(words)
+                        subquery: str = self.get_string_for(intent, strip=False)
+                        output.append(subquery)
+                    # Append None for now. Later I think I will have an intent recognizer
+                    else:
+                        output.append(None)
+                    continue
                 self.stars = match.stars
                 self.that_stars = match.that_stars
                 self.topic_stars = match.topic_stars
-                rendered: str = match.translatable.translate(self).strip()
-                if rendered != '' and not rendered[-1] in string.punctuation:
-                    rendered += '.'
-                if strip:
-                    for escaped, unesc in Brain._unescapes.items():
-                        rendered = rendered.replace(escaped, unesc)
-                that_lst.append(rendered)
-                output.append(rendered)
-        response: str = ' '.join(filter(bool, output))
+                volatile_count: int = self.volatile_count
+                rendered: str = match.translatable.translate(self)
+                if self.volatile_count == volatile_count:
+                    # The stars are saved as translating left them, as an <srai> may change them
+                    self.response_cache[key] =\
+                        (rendered, (self.stars, self.that_stars, self.topic_stars))
+                    if len(self.response_cache) > Brain._response_cache_size:
+                        self.response_cache.popitem(last = False)
+            rendered = rendered.strip()
+            if rendered != '' and not rendered[-1] in string.punctuation:
+                rendered += '.'
+            if strip:
+                for escaped, unesc in Brain._unescapes.items():
+                    rendered = rendered.replace(escaped, unesc)
+            that_lst.append(rendered)
+            output.append(rendered)
+        response: str = (output[0] or '') if len(output) == 1 else\
+            ' '.join(filter(bool, output))
         if strip:
             self.that_history.append(that_lst)
             self.history['response'].append(response)
-            self.trim_history()
         return response
     
     def trim_history(self):
-        """Limit the size of all histories to the specified max length"""
-        if self.brain_config is None or self.brain_config.max_history <= 0:
-            return
+        """Limit the size of all histories to the specified max length.
+        Histories are deques bounded to that length, so they stay trimmed as they grow"""
+        maxlen: Optional[int] = None
+        if self.brain_config is not None and self.brain_config.max_history > 0:
+            maxlen = self.brain_config.max_history
         for key, hlist in self.history.items():
-            self.history[key] = hlist[-self.brain_config.max_history:]
-        self.that_history = self.that_history[-self.brain_config.max_history:]
+            self.history[key] = deque(hlist, maxlen)
+        self.that_history = deque(self.that_history, maxlen)
     
     #==========Static methods used for utility/redundancy reduction==========
     
     @staticmethod
     def is_int(string: str) -> bool:
+        # Rejecting with a regex is much cheaper than raising and catching a ValueError,
+        # and most words tested against the integers set are not integers
+        if _INT_RE(string) is None:
+            return False
         try:
             int(string)
             return True
@@ -422,17 +596,37 @@ class Brain(object):
         if filename:
             try:
                 with open(filename, "w") as file:
-                    return json.dump(obj, file)
+                    file.write(fastjson.dumps(obj))
             except:
                 print(f'Could not serialize to {filename}',\
                 file = sys.stderr   )
     
+    @staticmethod
+    def set_time_locale(localet: str) -> None:
+        """Switch LC_TIME to localet, skipping the call into libc if it is already set"""
+        global _time_locale
+        if localet != _time_locale:
+            locale.setlocale(locale.LC_TIME, localet)
+            _time_locale = localet
+    
+    @staticmethod
+    def lower_keys(mapping: Dict[str, str]) -> Dict[str, str]:
+        """Lowercase and intern the keys of a dict. Where keys differ only in case,
+        the first one wins. Short string values are interned as well, since properties
+        and map values tend to repeat"""
+        lowered: Dict[str, str] = {}
+        for key, value in mapping.items():
+            if isinstance(value, str) and len(value) <= Brain._intern_max_len:
+                value = sys.intern(value)
+            lowered.setdefault(sys.intern(key.lower()), value)
+        return lowered
+    
     @staticmethod
     def deserialize(filename: str):
         if filename:
             try:
-                with open(filename) as file:
-                    return json.load(file)
+                with open(filename, "rb") as file:
+                    return fastjson.loads(file.read())
             except:
                 print(f'Could not deserialize {filename}', file=sys.stderr)
         return None
@@ -460,6 +654,10 @@ class Brain(object):
         'predecessor': lambda x: str(int(x) - 1) if Brain.is_int(x) else '',
         'python': lambda x: Brain.safe_eval(x)
     }
+    _automaton_threshold: ClassVar[int] = 8
+    _srai_cache_size: ClassVar[int] = 1024
+    _response_cache_size: ClassVar[int] = 256
+    _intern_max_len: ClassVar[int] = 32
     _unescapes: ClassVar[Dict[str, str]] = {
         '&lt;'  : '<',
         '&gt;'  : '>',
@@ -25,7 +25,13 @@ class BrainConfig:
     learn_file_path: path to read and write rules from <learn>
     bot_file_path: path to .json file with bot properties
     init_vars_file_path: path to .json file with current variable values
-    bow_file_path: path to .json with the bag of words intent classifications"""
+    bow_file_path: path to .json with the bag of words intent classifications
+    use_hyperscan: scan large substitutions with hyperscan, if it is installed
+    parse_workers: number of processes to parse brain_files in, 1 parses them in this one
+    cache_compiled: keep each parsed .aiml file's pattern tree in a .aimlc file beside it,
+        which is loaded instead of parsing the file again while it is unchanged.
+        .aimlc files are pickles, and loading a crafted one can run arbitrary code,
+        so only enable this for brain files in directories no one untrusted can write to"""
     max_history: int = field(default=-1)
     max_srai_recursion: int = field(default=30)
     brain_files: Iterable[str] = field(default_factory=list)
@@ -36,4 +42,7 @@ class BrainConfig:
     learn_file_path: str = 'knowledge.aiml'
     bot_file_path: str = 'bot.json'
     init_vars_file_path: str = 'var.json'
-    bow_file_path: str = 'bow.json'
\ No newline at end of file
+    bow_file_path: str = 'bow.json'
+    use_hyperscan: bool = False
+    parse_workers: int = 1
+    cache_compiled: bool = False
\ No newline at end of file
@@ -0,0 +1,31 @@
+"""
+aiml/aiml/fastjson.py
+c Yaakov Schectman 2022
+
+JSON reading and writing for bot, variable, set, map, substitution, and bag of words files.
+Uses orjson when it is installed, since it parses large files several times faster,
+and falls back to the standard json module otherwise
+"""
+
+import json
+from typing import (
+    Any,
+    Union
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def loads(src: Union[str, bytes]) -> Any:
+    """Parse a JSON document from a string or UTF-8 bytes"""
+    if orjson is not None:
+        return orjson.loads(src)
+    return json.loads(src)
+
+def dumps(obj: Any) -> str:
+    """Serialize obj to a JSON string"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj)
@@ -3,9 +3,14 @@ aiml/aiml/parser.py
 c Yaakov Schectman 2022
 """
 
+import functools
 import logging
-import re
+import os
+import pickle
+import sys
 import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import (
     dataclass,
     field
@@ -18,7 +23,10 @@ from typing import (
     Tuple,
     List,
     Dict,
+    Iterable,
+    Iterator,
     Optional,
+    Sequence,
     Set
 )
 
@@ -29,53 +37,179 @@ from .pattern import (
     WildcardType
 )
 from .translatable import *
-from .translatable import _stringops
+from .translatable import _fold, _stringops
 from .config import BrainConfig
 
+try:
+    from lxml import etree as _lxml_etree
+except ImportError:
+    _lxml_etree = None
+
+_CTRL_TABLE: Dict[int, None] = str.maketrans('', '', '\r\n\t')
+# lxml's parser is faster and lighter than ElementTree's on large AIML files.
+# Comments and processing instructions are dropped, as ElementTree.fromstring does,
+# and the text is always handed over as UTF-8 whatever the XML declaration says
+_lxml_parser: Optional['_lxml_etree.XMLParser'] = None if _lxml_etree is None else\
+    _lxml_etree.XMLParser(encoding = 'utf-8', remove_comments = True, remove_pis = True)
+# The tokens each wildcard word expands to, as a sequence so it can be extended directly
+_WILDCARDS: Dict[str, Tuple[PatternToken, ...]] = {
+    '#': (PatternTokens.OCTOTHORPE,),
+    '_': (PatternTokens.UNDERSCORE,),
+    '^': (PatternTokens.CARAT,),
+    '*': (PatternTokens.ASTERISK,)
+}
+
+# One shared PatternToken per distinct literal word, so equal tokens across the whole tree
+# are the same object, which saves memory and lets dict probes succeed on identity
+_TOKEN_POOL: Dict[str, PatternToken] = {}
+
+def _intern(word: str) -> PatternToken:
+    """Get the pooled literal PatternToken for an already lowercased word"""
+    token: Optional[PatternToken] = _TOKEN_POOL.get(word)
+    if token is None:
+        word = sys.intern(word)
+        token = _TOKEN_POOL[word] = PatternToken(literal_value = word)
+    return token
+
+@functools.lru_cache(maxsize = 65536)
+def _literal_to_pattern(toks: str) -> Tuple[PatternToken, ...]:
+    """The cached implementation of AimlParser.literal_to_pattern.
+    The same strings recur across categories and files, and the tokens are immutable,
+    so a tuple of them can be shared by every caller"""
+    words: List[str] = toks.lower().split()
+    pattern_toks: List[PatternToken] = []
+    extend = pattern_toks.extend
+    wildcards_get = _WILDCARDS.get
+    for word in words:
+        extend(wildcards_get(word) or\
+            ((PatternTokens.PRIORITY, _intern(word[1:])) if word[0] == '$' else\
+            (_intern(word),)))
+    return tuple(pattern_toks)
+
+# Bumped whenever the parser or the pickled classes change, so old .aimlc files are not loaded
+_CACHE_VERSION: int = 10
+
 @dataclass
 class AimlParser:
     """A parser to convert AIML XML data into a full pattern tree"""
     config: BrainConfig
-    topic_pattern: Optional[List[PatternToken]] = None
+    topic_pattern: Optional[Sequence[PatternToken]] = None
     sub_names: Set[str] = field(init = False, default_factory=set)
+    template_handlers: Dict[str, Callable[[ET.Element], Translatable]] =\
+        field(init = False, default_factory=dict, repr = False, compare = False)
+    # Parsed <learn> tags by their XML, as the same <learn> is often repeated across categories,
+    # in least recently used order
+    learn_cache: 'OrderedDict[str, TranslatableLearn]' =\
+        field(init = False, default_factory=OrderedDict, repr = False, compare = False)
     
     def __post_init__(self):
         if self.config is not None and self.config.sub_files:
             self.sub_names = set(map(\
                 lambda x: path.splitext(path.basename(x))[0].lower(),
                 self.config.sub_files))
+        # Substitution tags rank below template functions and string operations,
+        # but above repeats and stars
+        # The handlers are bound to this parser up front, so each call skips binding them
+        dispatch: Dict[str, Callable[['AimlParser', ET.Element], Translatable]] =\
+            dict(self._dispatch)
+        for tag in self.sub_names:
+            if tag not in self._template_funcs and tag not in _stringops:
+                dispatch[tag] = AimlParser.parse_subst
+        self.template_handlers = {tag: func.__get__(self) for tag, func in dispatch.items()}
     
     
     #==========Public facing methods to start parsing==========
     
     def parse(self, source: Union[IOBase, str]) -> PatternTree:
-        # return self.parse_aiml(ET.parse(source))
-        if isinstance(source, IOBase):
-            src: str = source.read()
-        else:
-            with open(source) as file:
-                src = file.read()
-        return self.parse_string(src)
+        """Parse an AIML file from a path or file object.
+        If the config enables cache_compiled and source is a path, the tree is loaded from
+        the .aimlc file beside it when that is still fresh, and written there otherwise.
+        .aimlc files are unpickled, so cache_compiled is only safe in trusted directories"""
+        if self.config is None or not self.config.cache_compiled or not isinstance(source, str):
+            return self.parse_file(source)
+        cache_path: str = path.splitext(source)[0] + '.aimlc'
+        stat: os.stat_result = os.stat(source)
+        # The tree also depends on which tags are substitutions, and on any enclosing topic
+        header: Tuple = (_CACHE_VERSION, stat.st_mtime_ns, stat.st_size,\
+            tuple(sorted(self.sub_names)), tuple(self.topic_pattern or ()))
+        try:
+            cached: Optional[PatternTree] = PatternTree.load(cache_path, header)
+            if cached is not None:
+                return cached
+        except FileNotFoundError:
+            pass
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            # Only what a truncated or corrupt cache can cause, so real bugs still surface
+            logging.warning(f'Could not load {cache_path}: {e}')
+        root: PatternTree = self.parse_file(source)
+        try:
+            root.dump(cache_path, header)
+        except Exception as e:
+            logging.warning(f'Could not write {cache_path}: {e}')
+            # Don't leave a partly written file to be tried again next time
+            if path.exists(cache_path):
+                os.remove(cache_path)
+        return root
+    
+    def parse_file(self, source: Union[IOBase, str]) -> PatternTree:
+        """Parse an AIML file from a path or file object, without any .aimlc cache.
+        Each top-level <category> or <topic> is parsed as soon as it has been read and then
+        discarded, so the document is never held in memory all at once"""
+        root: PatternTree = PatternTree()
+        aiml: Optional[ET.Element] = None
+        depth: int = 0
+        for event, elem in AimlParser.iterparse(source):
+            if event == 'start':
+                # Tags are compared in lowercase, so they are lowercased once here
+                elem.tag = elem.tag.lower()
+                if aiml is None:
+                    aiml = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            AimlParser.collapse_element(elem)
+            tag: str = elem.tag
+            if tag == 'category':
+                root.merge(self.parse_category(elem))
+            elif tag == 'topic':
+                root.merge(self.parse_topic(elem))
+            else:
+                raise ValueError(f'Unexpected tag {elem.tag} in <aiml>')
+            aiml.clear()
+        return root
+    
+    def parse_many(self, sources: Iterable[str], max_workers: Optional[int] = None)\
+            -> PatternTree:
+        """Parse several AIML files in a pool of worker processes and merge them into one tree.
+        The files are independent of each other, so each is parsed by whichever worker is free,
+        and the results are merged in the order the sources were given"""
+        root: PatternTree = PatternTree()
+        with ProcessPoolExecutor(max_workers) as executor:
+            for tree in executor.map(self.parse, sources):
+                root.merge(tree)
+        return root
     
     def parse_string(self, source: str) -> PatternTree:
         """Parse a provided string"""
-        preproc: str = re.sub('[\r\n\t]+', '', source)
-        preproc = re.sub('\\s+', ' ', preproc)
-        source\
-            .replace('\n', '')\
-            .replace('\\n', '\n')\
-            .replace('\t', '')\
-            .replace('\\t', '\t')
-        root: ET.Element = ET.fromstring(preproc)
+        preproc: str = AimlParser.collapse_whitespace(source)
+        root: ET.Element
+        if _lxml_parser is not None:
+            root = _lxml_etree.fromstring(preproc.encode('utf-8'), _lxml_parser)
+        else:
+            root = ET.fromstring(preproc)
+        AimlParser.lowercase_tags(root)
         return self.parse_aiml(root)
     
     def parse_aiml(self, elem: ET.Element) -> PatternTree:
         """Parse the root <aiml>"""
         root: PatternTree = PatternTree()
         for child in elem:
-            if child.tag.lower() == 'category':
+            tag: str = child.tag
+            if tag == 'category':
                 root.merge(self.parse_category(child))
-            elif child.tag.lower() == 'topic':
+            elif tag == 'topic':
                 root.merge(self.parse_topic(child))
             else:
                 raise ValueError(f'Unexpected tag {child.tag} in <aiml>')
@@ -83,41 +217,31 @@ class AimlParser:
     
     def parse_category(self, elem: ET.Element) -> PatternTree:
         """Parse a <category>, either in <aiml> or <topic>"""
-        pattern: Optional[Tuple[PatternTree, PatternTree]] = None
-        that: Optional[Tuple[PatternTree, PatternTree]] = None
-        topic: Optional[Tuple[PatternTree, PatternTree]] = None
+        pattern: Optional[List[PatternToken]] = None
+        that: Optional[List[PatternToken]] = None
+        topic: Optional[Sequence[PatternToken]] = None
         template: Optional[Translatable] = None
         for child in elem:
-            if child.tag.lower() == 'pattern':
+            tag: str = child.tag
+            if tag == 'pattern':
                 pattern = self.parse_pattern(child)
-            elif child.tag.lower() == 'that':
+            elif tag == 'that':
                 that = self.parse_pattern(child)
-            elif child.tag.lower() == 'topic':
+            elif tag == 'topic':
                 if self.topic_pattern is not None:
                     raise ValueError('Cannot declare category-level <topic> under top-level <topic>')
                 topic = self.parse_pattern(child)
-            elif child.tag.lower() == 'template':
+            elif tag == 'template':
                 template = self.parse_template(child)
             else:
                 raise ValueError(f'Unexpected tag {child.tag} in <category>')
         if pattern is None or template is None:
             raise ValueError('Missing <pattern> or <template> in <category>')
         if self.topic_pattern is not None:
-            topic_root: PatternTree = PatternTree()
-            topic_leaf: PatternTree = topic_root
-            for tok in self.topic_pattern:
-                topic_leaf.index[tok] = PatternTree()
-                topic_leaf = topic_leaf.index[tok]
-            topic = (topic_root, topic_leaf)
-        root: PatternTree = pattern[0]
-        leaf: PatternTree = pattern[1]
-        if that is not None:
-            leaf.index[PatternTokens.DELIM_THAT] = that[0]
-            leaf = that[1]
-        if topic is not None:
-            leaf.index[PatternTokens.DELIM_TOPIC] = topic[0]
-            leaf = topic[1]
-        leaf.terminal = template
+            topic = self.topic_pattern
+        # The pattern, THAT, and TOPIC are built into one chain by a single add
+        root: PatternTree = PatternTree()
+        root.add(pattern, template, that, topic)
         return root
     
     #==========For the most part, these methods are only called internally==========
@@ -130,46 +254,35 @@ class AimlParser:
         self.topic_pattern = AimlParser.literal_to_pattern(elem.get('name'))
         root: PatternTree = PatternTree()
         for child in elem:
-            if child.tag.lower() != 'category':
+            if child.tag != 'category':
                 raise ValueError(f'Unexpected tag {child.tag} in top-level <topic>')
             branch: PatternTree = self.parse_category(child)
             root.merge(branch)
         self.topic_pattern = None
         return root
     
-    def parse_pattern(self, pattern_elem: ET.Element) -> Tuple[PatternTree, PatternTree]:
-        """Parse a <pattern> element into a PatternTree
-        Returns (the root of the tree, the leaf that matches the pattern)"""
-        root: PatternTree = PatternTree()
-        leaf: PatternTree = root
+    def parse_pattern(self, pattern_elem: ET.Element) -> List[PatternToken]:
+        """Parse a <pattern>, <that>, or <topic> element into its PatternTokens in order"""
+        toks: List[PatternToken] = []
         if pattern_elem.text:
-            toks: List[PatternToken] = AimlParser.literal_to_pattern(pattern_elem.text)
-            for tok in toks:
-                leaf.index[tok] = PatternTree()
-                leaf = leaf.index[tok]
-        for i, child in enumerate(pattern_elem):
-            toks: List[PatternToken] = self.parse_pattern_child(child)
-            for tok in toks:
-                leaf.index[tok] = PatternTree()
-                leaf = leaf.index[tok]
+            toks.extend(AimlParser.literal_to_pattern(pattern_elem.text))
+        for child in pattern_elem:
+            toks.extend(self.parse_pattern_child(child))
             if child.tail:
-                toks = AimlParser.literal_to_pattern(child.tail)
-                for tok in toks:
-                    leaf.index[tok] = PatternTree()
-                    leaf = leaf.index[tok]
-        return (root, leaf)
+                toks.extend(AimlParser.literal_to_pattern(child.tail))
+        return toks
     
     def parse_pattern_child(self, elem: ET.Element) -> List[PatternToken]:
         """Parses a <set>, <get>, or <bot> tag within a <pattern>"""
-        if elem.tag.lower() == 'set':
+        if elem.tag == 'set':
             name: str = AimlParser.get_string_by_key(elem, 'name')
             return [PatternTokens.SET_MAP, PatternToken(name)]
-        elif elem.tag.lower() == 'get':
+        elif elem.tag == 'get':
             name: str = AimlParser.get_string_by_key(elem, 'name', False)
             if name is None:
                 name = AimlParser.get_string_by_key(elem, 'var')
             return [PatternTokens.GET_VAR, PatternToken(name)]
-        elif elem.tag.lower() == 'bot':
+        elif elem.tag == 'bot':
             name: str = AimlParser.get_string_by_key(elem, 'name', False)
             if name is None:
                 name = AimlParser.get_string_by_key(elem, 'var')
@@ -182,27 +295,27 @@ class AimlParser:
     
     def _parse_template_expr(self, elem: ET.Element, ignore: Optional[Set[str]] = None) -> Translatable:
         sequence: List[Translatable] = []
-        if elem.text:
-            sequence.append(TranslatableWord(elem.text))
+        # Text is held back until something else is appended, so that the text around
+        # skipped children becomes a single TranslatableWord
+        pending_text: str = elem.text or ''
+        handlers: Dict[str, Callable[[ET.Element], Translatable]] = self.template_handlers
         for child in elem:
-            if ignore is None or child.tag.lower() not in ignore:
-                if child.tag.lower() in self._template_funcs:
-                    sequence.append(self._template_funcs[child.tag.lower()](self, child))
-                elif child.tag.lower() in _stringops:
-                    sequence.append(TranslatableStringop(self.parse_template(child), child.tag.lower()))
-                elif child.tag.lower() in self.sub_names:
-                    sequence.append(TranslatableSubst(child.tag.lower(), self.parse_template(child)))
-                elif child.tag.lower() in self._repeats:
-                    sequence.append(self.parse_repeat(child))
-                elif child.tag.lower() in self._stars:
-                    sequence.append(self.parse_star(child))
+            tag: str = child.tag
+            handler: Optional[Callable[[ET.Element], Translatable]] = handlers.get(tag)
+            if handler is not None and (ignore is None or tag not in ignore):
+                if pending_text:
+                    sequence.append(translatable_word(pending_text))
+                    pending_text = ''
+                sequence.append(handler(child))
             if child.tail:
-                sequence.append(TranslatableWord(child.tail))
+                pending_text += child.tail
+        if pending_text:
+            sequence.append(translatable_word(pending_text))
         if len(sequence) == 1:
             return sequence[0]
         elif len(sequence) == 0:
             return TranslatableNull()
-        return TranslatableIterable(sequence)
+        return _fold(TranslatableIterable(sequence))
     
     def parse_condition(self, elem: ET.Element) -> TranslatableCondition:
         """Parse <condition> with its included <li>"""
@@ -211,12 +324,13 @@ class AimlParser:
         mapping: List[Tuple[Translatable, Translatable, Translatable, bool]] = []
         if def_name and def_val:
             inner: Translatable = self._parse_template_expr(elem, {'name', 'value', 'loop'})
-            mapping.append((def_name, def_val, inner, AimlParser.has_child(elem, False)))
+            mapping.append((def_name, def_val, inner, AimlParser.has_child(elem, 'loop')))
             return TranslatableCondition(mapping)
         default: Optional[Tuple[Translatable, bool]] = None
         for child in elem:
-            if child.tag.lower() != 'li':
-                if child.tag.lower() not in {'name'}:
+            tag: str = child.tag
+            if tag != 'li':
+                if tag not in {'name'}:
                     raise ValueError(f'Unexpected tag {child.tag} in <condition>')
                 continue
             match_val: Optional[Translatable] = self.get_translatable_by_key(child, 'value', False)
@@ -232,15 +346,15 @@ class AimlParser:
                 mapping.append((match_name, match_val, inner, AimlParser.has_child(child, 'loop')))
         return TranslatableCondition(mapping, default)
     
-    def parse_random(self, elem: ET.Element) -> TranslatableRandom:
+    def parse_random(self, elem: ET.Element) -> Translatable:
         """Parse <random>"""
         choices: List[Translatable] = []
         for child in elem:
-            if child.tag.lower() != 'li':
+            if child.tag != 'li':
                 raise ValueError(f'Unexepcted tag {child.tag} in <random>')
             choice: Translatable = self.parse_template(child)
             choices.append(choice)
-        return TranslatableRandom(choices)
+        return _fold(TranslatableRandom(choices))
     
     def parse_set(self, elem: ET.Element) -> TranslatableSet:
         """Parse a <set> tag that assigns a predicate"""
@@ -276,20 +390,37 @@ class AimlParser:
         
     def parse_learn(self, elem: ET.Element) -> TranslatableLearn:
         """Parse <learn>"""
-        if len(elem) != 1 or elem[0].tag.lower() != 'category':
+        if len(elem) != 1 or elem[0].tag != 'category':
             raise ValueError('<learn> tag must have exactly one child <condition> tag')
+        # A TranslatableLearn copies its template before evaluating it, so one can be shared
+        key: str = ET.tostring(elem[0], 'unicode')
+        learn: Optional[TranslatableLearn] = self.learn_cache.get(key)
+        if learn is not None:
+            self.learn_cache.move_to_end(key)
+            return learn
         pattern, template, that, topic = self.parse_learned_category(elem[0])
-        return TranslatableLearn(pattern, template, that, topic)
+        learn = self.learn_cache[key] = TranslatableLearn(pattern, template, that, topic)
+        if len(self.learn_cache) > AimlParser._learn_cache_size:
+            self.learn_cache.popitem(last = False)
+        return learn
     
     def parse_star(self, elem: ET.Element) -> TranslatableStar:
         """Parse <star>, <thatstar>, and <topicstar>"""
         index: int = int(AimlParser.get_string_by_key(elem, 'index', False) or 1)
-        return TranslatableStar(index, elem.tag.lower())
+        return TranslatableStar(index, elem.tag)
     
     def parse_repeat(self, elem: ET.Element) -> TranslatableRepeat:
         """Parse <input>, <response>, and <request>"""
         index: int = int(AimlParser.get_string_by_key(elem, 'index', False) or 1)
-        return TranslatableRepeat(index = index, repeat_type = elem.tag.lower())
+        return TranslatableRepeat(index = index, repeat_type = elem.tag)
+    
+    def parse_stringop(self, elem: ET.Element) -> Translatable:
+        """Parse a string operation such as <uppercase> or <formal>"""
+        return _fold(TranslatableStringop(self.parse_template(elem), elem.tag))
+    
+    def parse_subst(self, elem: ET.Element) -> TranslatableSubst:
+        """Parse a tag named after one of the configured substitution files"""
+        return TranslatableSubst(elem.tag, self.parse_template(elem))
     
     def parse_that_template(self, elem: ET.Element) -> TranslatableThat:
         """Parse <that> inside a template"""
@@ -318,13 +449,14 @@ class AimlParser:
         """Parse a <category> inside a <learn>"""
         category: List = [None, None, None, None]
         for child in elem:
-            if child.tag.lower() == 'pattern':
+            tag: str = child.tag
+            if tag == 'pattern':
                 category[0] = self.parse_learned_pattern(child)
-            elif child.tag.lower() == 'template':
+            elif tag == 'template':
                 category[1] = self.parse_template(child)
-            elif child.tag.lower() == 'that':
+            elif tag == 'that':
                 category[2] = self.parse_learned_pattern(child)
-            elif child.tag.lower() == 'topic':
+            elif tag == 'topic':
                 category[3] = self.parse_learned_pattern(child)
         if category[0] is None or category[1] is None:
             raise ValueError('<pattern> and <template> must be present in a category')
@@ -335,14 +467,14 @@ class AimlParser:
         """Parse a <pattern> within a <learn>"""
         seq: List = []
         if elem.text:
-            seq.append(TranslatableWord(elem.text))
+            seq.append(translatable_word(elem.text))
         for child in elem:
-            if child.tag.lower() == 'eval':
+            if child.tag == 'eval':
                 seq.append(self.parse_eval(child))
             else:
                 seq.append(TranslatableWord(ET.tostring(child, 'unicode')))
             if child.tail:
-                seq.append(TranslatableWord(child.tail))
+                seq.append(translatable_word(child.tail))
         return seq
     
     def parse_unlearn(self, elem: ET.Element) -> TranslatableUnlearn:
@@ -352,29 +484,11 @@ class AimlParser:
     #==========A public-facing static method that Brain also uses=========
 
     @staticmethod
-    def literal_to_pattern(toks: str) -> List[PatternToken]:
+    def literal_to_pattern(toks: str) -> Tuple[PatternToken, ...]:
         """Lowercases and whitespace-strips the provided string,
         then tokenizes it into words splitting by whitespace and returns
-        a list of PatternTokens in sequential order"""
-        words: List[str] = re.split('\\s+', toks.lower().strip())
-        pattern_toks: List[PatternToken] = []
-        for word in words:
-            if word[0] == '$':
-                pattern_toks.append(PatternTokens.PRIORITY)
-                pattern_toks.append(PatternToken(\
-                    literal_value = word[1:]))#.translate(str.maketrans('', '', string.punctuation))))
-            elif word == '#':
-                pattern_toks.append(PatternTokens.OCTOTHORPE)
-            elif word == '_':
-                pattern_toks.append(PatternTokens.UNDERSCORE)
-            elif word == '^':
-                pattern_toks.append(PatternTokens.CARAT)
-            elif word == '*':
-                pattern_toks.append(PatternTokens.ASTERISK)
-            else:
-                pattern_toks.append(PatternToken(\
-                    literal_value = word))#.translate(str.maketrans('', '', string.punctuation))))
-        return pattern_toks
+        a tuple of PatternTokens in sequential order"""
+        return _literal_to_pattern(toks)
     
     #==========Helper functions to reduce redundancy of code==========
     
@@ -383,46 +497,102 @@ class AimlParser:
         """First look if there is an attribute in elem named key, then look for a child
         node with that tag. If none is found, and die is True, raise an error,
         otherwise return None"""
-        val: Optional[str] = None
-        attribs: Dict[str, str] = dict(map(lambda x: (x[0].lower(), x[1]), elem.attrib.items()))
-        if key in attribs and attribs[key]:
-            val = attribs[key]
+        val: Optional[str] = AimlParser.get_attribute(elem, key)
         if val:
-            return TranslatableWord(val)
-        for child in elem:
-            if child.tag.lower() == key:
-                return self.parse_template(child)
+            return translatable_word(val)
+        child: Optional[ET.Element] = AimlParser.find_child(elem, key)
+        if child is not None:
+            return self.parse_template(child)
         if die:
             raise ValueError(f"No string named {key} in element '{elem.tag}'")
         return None
     
+    @staticmethod
+    def collapse_whitespace(text: str) -> str:
+        """Remove line breaks and tabs, then collapse runs of whitespace to one space"""
+        text = text.translate(_CTRL_TABLE)
+        words: List[str] = text.split()
+        if not words:
+            return ' ' if text else ''
+        # str.split() drops leading and trailing whitespace, which is kept as one space
+        collapsed: str = ' '.join(words)
+        if text[0].isspace():
+            collapsed = ' ' + collapsed
+        if text[-1].isspace():
+            collapsed += ' '
+        return collapsed
+    
+    @staticmethod
+    def collapse_element(elem: ET.Element) -> None:
+        """Collapse the whitespace of all text and attributes under an element in place,
+        as parse_string does to a whole document before parsing it"""
+        for node in elem.iter():
+            if node.text:
+                node.text = AimlParser.collapse_whitespace(node.text)
+            if node.tail and node is not elem:
+                node.tail = AimlParser.collapse_whitespace(node.tail)
+            for key, value in node.attrib.items():
+                node.attrib[key] = AimlParser.collapse_whitespace(value)
+    
+    @staticmethod
+    def lowercase_tags(elem: ET.Element) -> None:
+        """Lowercase the tags of an element and everything under it in place,
+        as parse does while reading, so that tags can be compared directly"""
+        for node in elem.iter():
+            node.tag = node.tag.lower()
+    
+    @staticmethod
+    def iterparse(source: Union[IOBase, str]) -> Iterator[Tuple[str, ET.Element]]:
+        """Yield start and end events for the elements of an XML file, using lxml
+        if it is installed. Comments and processing instructions are left out"""
+        if _lxml_etree is not None and isinstance(source, str):
+            return _lxml_etree.iterparse(source, events = ('start', 'end'),\
+                remove_comments = True, remove_pis = True)
+        return ET.iterparse(source, events = ('start', 'end'))
+    
     @staticmethod
     def get_string_by_key(elem: ET.Element, key: str, die: bool = True) -> Optional[str]:
         """Get a literal string, same as get_translatable_by_key"""
-        val: Optional[str] = None
-        attribs: Dict[str, str] = dict(map(lambda x: (x[0].lower(), x[1]), elem.attrib.items()))
-        if key in attribs:
-            val = attribs[key]
+        val: Optional[str] = AimlParser.get_attribute(elem, key)
         if not val:
-            for child in elem:
-                child: ET.Element = elem[0]
-                if child.tag.lower() == key:
-                    val = child.text
-                    break
+            child: Optional[ET.Element] = AimlParser.find_child(elem, key)
+            if child is not None:
+                val = child.text
         if not val and die:
             raise ValueError(f"No string named {key} in element '{elem.tag}'")
         return val or None
     
+    @staticmethod
+    def get_attribute(elem: ET.Element, key: str) -> Optional[str]:
+        """Get the attribute of elem named key, ignoring the attribute name's case.
+        AIML attributes are nearly always lowercase already, or else all uppercase,
+        so those names are tried before scanning the rest"""
+        attrib: Dict[str, str] = elem.attrib
+        val: Optional[str] = attrib.get(key)
+        if val is not None or not attrib:
+            return val
+        val = attrib.get(key.upper())
+        if val is not None:
+            return val
+        for name, value in attrib.items():
+            if name.lower() == key:
+                return value
+        return None
+    
     @staticmethod
     def has_child(elem: ET.Element, key: str) -> bool:
         """Return True iff elem conains a child node with tag == key"""
-        for child in elem:
-            if child.tag.lower() == key:
-                return True
-        return False
+        return AimlParser.find_child(elem, key) is not None
+    
+    @staticmethod
+    def find_child(elem: ET.Element, key: str) -> Optional[ET.Element]:
+        """Get the first child of elem whose tag is key.
+        Tags are lowercased as they are read, so the parser's native find can do this"""
+        return elem.find(key)
     
     #==========Internally used class vars, here to stay out of the way==========
     
+    _learn_cache_size: ClassVar[int] = 256
     _repeats: ClassVar[Set[str]] = {
         'response',
         'input',
@@ -449,4 +619,12 @@ class AimlParser:
         'eval':         parse_eval,
         'unlearn':      parse_unlearn
     }
+    # Every template tag that does not depend on the configuration, mapped to its parser.
+    # Later groups take precedence over earlier ones, as in the old if/elif chain
+    _dispatch: ClassVar[Dict[str, Callable[['AimlParser', ET.Element], Translatable]]] = {
+        **dict.fromkeys(_stars, parse_star),
+        **dict.fromkeys(_repeats, parse_repeat),
+        **dict.fromkeys(_stringops, parse_stringop),
+        **_template_funcs
+    }
         
\ No newline at end of file
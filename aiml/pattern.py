@@ -2,9 +2,12 @@
 aiml/pattern.py
 c Yaakov Schectman 2022
 """
+import functools
 import logging
+import pickle
 import re
 import string
+import sys
 from enum import (
     auto,
     Enum
@@ -14,15 +17,42 @@ from dataclasses import (
     field
 )
 from typing import (
+    Any,
     Dict,
     List,
+    NamedTuple,
     Optional,
+    Sequence,
     Tuple,
     Union
 )
 
 from .protocols import ContextLike
 
+# A tree can hold a node per word of every pattern, so nodes and tokens use __slots__
+# where dataclasses support it, which saves memory and speeds attribute access
+_slots: Dict[str, bool] = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+# THAT and TOPIC strings are split on whitespace every time a pattern reaches their clause
+_WS_RE: re.Pattern = re.compile('\\s+')
+_PUNCT_TABLE: Dict[int, None] = str.maketrans('', '', string.punctuation)
+# Written at the start of every file from PatternTree.dump, so other files are never unpickled
+_DUMP_MAGIC: bytes = b'AIMLTREE'
+
+@functools.lru_cache(maxsize = 4096)
+def _normalize(text: str) -> str:
+    """Lowercase text and strip its punctuation, for comparing input words to bot and
+    user variables. Keyed by the text itself, so a changed variable can never be
+    served a stale result"""
+    return text.lower().translate(_PUNCT_TABLE)
+
+@functools.lru_cache(maxsize = 256)
+def _clause_words(text: str) -> Tuple[str, ...]:
+    """Lowercase a THAT or TOPIC string, strip its punctuation, and split it into words.
+    Every node a search reaches at the end of the input needs these, and they only
+    change when the bot replies or the topic is set"""
+    return tuple(_WS_RE.split(_normalize(text)))
+
 class WildcardType(Enum):
     PRIORITY        =  0
     OCTOTHORPE      =  1
@@ -37,21 +67,48 @@ class WildcardType(Enum):
     DELIM_TOPIC     = 10
     END_PATTERN     = 11
 
-@dataclass
+@dataclass(frozen = True, **_slots)
 class PatternToken(object):
     """
     A single element within a pattern to match
     """
     literal_value: Optional[str] = None
     wildcard_type: WildcardType = WildcardType.LITERAL
+    # Tokens are hashed and compared on every dict probe, so the lowercase literal
+    # and the hash are worked out once, which is why tokens are frozen
+    lowered: str = field(init = False, repr = False, compare = False)
+    hashed: int = field(init = False, repr = False, compare = False)
+    
+    def __post_init__(self) -> None:
+        lowered: str = (self.literal_value or '').lower()
+        object.__setattr__(self, 'lowered', lowered)
+        object.__setattr__(self, 'hashed', hash((self.wildcard_type.value, lowered)))
     
     def __hash__(self) -> int:
-        return hash(self.wildcard_type.value * 257 + hash((self.literal_value or '').lower()))
+        return self.hashed
+    
+    def __reduce__(self) -> Tuple[type, Tuple[Optional[str], WildcardType]]:
+        # String hashes differ between processes, so an unpickled token is rebuilt
+        # to work its hash out again rather than restoring the stored one
+        return (PatternToken, (self.literal_value, self.wildcard_type))
     
     def __eq__(self, other: 'PatternToken') -> bool:
-        return self.wildcard_type == other.wildcard_type and\
-            self.literal_value.lower() ==\
-            other.literal_value.lower()
+        # Wildcards have no literal value. They used to be compared by identity alone,
+        # but copies of them are made whenever a tree is unpickled
+        return self is other or\
+            (self.wildcard_type is other.wildcard_type and self.lowered == other.lowered)
+
+# Edges that consume one input word. PRIORITY, SET_MAP, BOT_VAR, and GET_VAR edges lead to
+# a layer of literal tokens that does the consuming, and # and ^ may match nothing
+_CONSUMES_WORD: Tuple[WildcardType, ...] = (
+    WildcardType.LITERAL,
+    WildcardType.UNDERSCORE,
+    WildcardType.ASTERISK
+)
+_DELIMITERS: Tuple[WildcardType, ...] = (
+    WildcardType.DELIM_THAT,
+    WildcardType.DELIM_TOPIC
+)
 
 class PatternTokens(object):
     """
@@ -69,7 +126,7 @@ class PatternTokens(object):
     DELIM_TOPIC:    PatternToken = PatternToken(wildcard_type = WildcardType.DELIM_TOPIC)
     END_PATTERN:    PatternToken = PatternToken(wildcard_type = WildcardType.END_PATTERN)
 
-@dataclass
+@dataclass(**_slots)
 class PatternMatch:
     """A match made on a certain pattern, including the wildcards matched along the way"""
     translatable: 'Translatable'
@@ -93,168 +150,401 @@ class PatternMatch:
             that_stars = self.that_stars,\
             topic_stars = self.stars)
 
-@dataclass
+class _Branches(NamedTuple):
+    """The children of a PatternTree besides literal words, looked up once when the tree
+    is compiled rather than probed for every time matching visits the node"""
+    priority: Optional['PatternTree'] = None
+    # Octothorpe or underscore, and how many words it must match at least
+    high_star: Optional['PatternTree'] = None
+    high_star_skip: int = 0
+    bot_var: Optional['PatternTree'] = None
+    get_var: Optional['PatternTree'] = None
+    set_map: Optional['PatternTree'] = None
+    # Carat or asterisk, and how many words it must match at least
+    low_star: Optional['PatternTree'] = None
+    low_star_skip: int = 0
+    that: Optional['PatternTree'] = None
+    topic: Optional['PatternTree'] = None
+    
+    @staticmethod
+    def of(index: Dict[PatternToken, 'PatternTree']) -> '_Branches':
+        """Classify the children in a node's index. Nodes with only literal children
+        all share one empty _Branches"""
+        if all(token.wildcard_type is WildcardType.LITERAL for token in index):
+            return _NO_BRANCHES
+        high_star: Optional['PatternTree'] = index.get(PatternTokens.OCTOTHORPE)
+        high_star_skip: int = 0
+        if high_star is None:
+            high_star = index.get(PatternTokens.UNDERSCORE)
+            high_star_skip = 1
+        low_star: Optional['PatternTree'] = index.get(PatternTokens.CARAT)
+        low_star_skip: int = 0
+        if low_star is None:
+            low_star = index.get(PatternTokens.ASTERISK)
+            low_star_skip = 1
+        return _Branches(index.get(PatternTokens.PRIORITY),\
+            high_star,\
+            high_star_skip,\
+            index.get(PatternTokens.BOT_VAR),\
+            index.get(PatternTokens.GET_VAR),\
+            index.get(PatternTokens.SET_MAP),\
+            low_star,\
+            low_star_skip,\
+            index.get(PatternTokens.DELIM_THAT),\
+            index.get(PatternTokens.DELIM_TOPIC))
+
+_NO_BRANCHES: _Branches = _Branches()
+# Shared by every node with no literal children, and never modified
+_NO_LITERALS: Dict[str, 'PatternTree'] = {}
+
+# Where a _MatchFrame is in trying its node's alternatives, in order of priority
+_START:         int = 0
+_TRY_THAT:      int = 1
+_TRY_TOPIC:     int = 2
+_TRY_TERMINAL:  int = 3
+_TRY_PRIORITY:  int = 4
+_TRY_HIGH_STAR: int = 5
+_TRY_BOT_VAR:   int = 6
+_TRY_GET_VAR:   int = 7
+_TRY_LITERAL:   int = 8
+_TRY_SET_MAP:   int = 9
+_TRY_LOW_STAR:  int = 10
+_EXHAUSTED:     int = 11
+
+# Markers for a frame that was entered at the start of a THAT or TOPIC clause,
+# and for a node that completes the match being searched for
+_ENTERED_THAT: object = object()
+_ENTERED_TOPIC: object = object()
+_MATCHED: object = object()
+
+@dataclass(**_slots)
+class _MatchFrame:
+    """A node being visited by PatternTree.match, with the words left for it"""
+    node: 'PatternTree'
+    words: Sequence[str]
+    pos: int
+    # What the parent matched to get here: a star, _ENTERED_THAT, _ENTERED_TOPIC, or None
+    entered: object = None
+    step: int = _START
+    # Progress through a wildcard's possible lengths, or through a branch's children
+    cursor: Any = None
+
+@dataclass(**_slots)
 class PatternTree:
     index: Dict[PatternToken, 'PatternTree'] = field(default_factory = dict)
     terminal: Optional['Translatable'] = None
+    # The fewest input words any match from this node can consume, as found by .compile().
+    # 0 is always a safe value, so nodes that have changed since then are reset to it
+    min_words: int = field(default = 0, compare = False)
+    compiled: bool = field(default = False, compare = False)
+    # The children matching tries other than literal words, also found by .compile()
+    branches: Optional['_Branches'] = field(default = None, compare = False, repr = False)
+    # The literal children keyed by their lowercase word, so matching can look up an input
+    # word without building a PatternToken for it
+    literals: Optional[Dict[str, 'PatternTree']] =\
+        field(default = None, compare = False, repr = False)
     
     def add(self,\
             pattern_tokens: List[PatternToken],\
             result: 'Translatable',\
             that_tokens: Optional[List[PatternToken]] = None,\
             topic_tokens: Optional[List[PatternToken]] = None) -> None:
-        """Recursively traverse a tree and add the result of a pattern to it"""
-        if len(pattern_tokens) == 0:
-            if that_tokens is not None:
-                sub_tree: 'PatternTree' = PatternTree()
-                sub_tree.add(that_tokens, result, None, topic_tokens)
-                self.index[PatternTokens.DELIM_THAT] = sub_tree
-            elif topic_tokens is not None:
-                sub_tree: 'PatternTree' = PatternTree()
-                sub_tree.add(topic_tokens, result, None, None)
-                self.index[PatternTokens.DELIM_TOPIC] = sub_tree
-            else:
-                self.terminal = result
-            return
-        prefix: PatternToken = pattern_tokens[0]
-        if prefix not in self.index:
-            self.index[prefix] = PatternTree()
-        self.index[prefix].add(pattern_tokens[1:], result, that_tokens, topic_tokens)
+        """Walk down the tree along a pattern, adding nodes where needed,
+        and add the result of the pattern to it"""
+        node: PatternTree = self
+        for prefix in pattern_tokens:
+            node.invalidate()
+            child: Optional[PatternTree] = node.index.get(prefix)
+            if child is None:
+                child = node.index[prefix] = PatternTree()
+            node = child
+        node.invalidate()
+        if that_tokens is not None:
+            sub_tree: 'PatternTree' = PatternTree()
+            sub_tree.add(that_tokens, result, None, topic_tokens)
+            node.index[PatternTokens.DELIM_THAT] = sub_tree
+        elif topic_tokens is not None:
+            sub_tree: 'PatternTree' = PatternTree()
+            sub_tree.add(topic_tokens, result, None, None)
+            node.index[PatternTokens.DELIM_TOPIC] = sub_tree
+        else:
+            node.terminal = result
     
     def merge(self, other: 'PatternTree') -> None:
         """Merge all pattersn from another tree into this one
-        Overrides conflicting patterns with those of the other tree"""
-        for key in other.index:
-            if key in self.index:
-                self.index[key].merge(other.index[key])
-            else:
-                self.index[key] = other.index[key]
-        if other.terminal is not None:
-            self.terminal = other.terminal
+        Overrides conflicting patterns with those of the other tree.
+        Pairs of nodes that both trees have are merged from a stack rather than recursively"""
+        pairs: List[Tuple[PatternTree, PatternTree]] = [(self, other)]
+        while pairs:
+            node, other_node = pairs.pop()
+            node.invalidate()
+            index: Dict[PatternToken, PatternTree] = node.index
+            for key, other_child in other_node.index.items():
+                child: Optional[PatternTree] = index.get(key)
+                if child is None:
+                    index[key] = other_child
+                else:
+                    pairs.append((child, other_child))
+            if other_node.terminal is not None:
+                node.terminal = other_node.terminal
     
     def match(self,\
-            sentence: List[str],\
+            sentence: Sequence[str],\
             context: ContextLike) -> Optional[PatternMatch]:
-        """Search for a match in this pattern tree for provided word list"""
+        """Search for a match in this pattern tree for provided word list.
+        The tree is searched depth first with an explicit stack of frames, trying each node's
+        children in order of priority and backing up a level when a node has none left,
+        so long sentences cannot exhaust the recursion limit"""
+        self.compile()
+        if len(sentence) < self.min_words:
+            return None
+        stack: List[_MatchFrame] = [_MatchFrame(self, sentence, 0)]
+        while stack:
+            frame: _MatchFrame = stack[-1]
+            child: Union[_MatchFrame, object, None] = frame.node.next_child(frame, context)
+            if child is None:
+                stack.pop()
+            elif child is _MATCHED:
+                return PatternTree.collect_match(stack)
+            else:
+                stack.append(child)
+        return None
+    
+    def next_child(self,\
+            frame: '_MatchFrame',\
+            context: ContextLike) -> Union['_MatchFrame', object, None]:
+        """Get a frame for the next alternative below this node, which frame is visiting,
+        and move frame past it. Returns _MATCHED if this node completes a match itself,
+        or None once there are no alternatives left"""
+        branches: _Branches = self.branches
+        words: Sequence[str] = frame.words
+        pos: int = frame.pos
+        step: int = frame.step
+        if step == _START:
+            step = _TRY_THAT if pos == len(words) else _TRY_PRIORITY
+        
         # If there are no more words left, either we have a match here or we have no match
-        if len(sentence) == 0:
+        if step == _TRY_THAT:
+            step = frame.step = _TRY_TOPIC
             # A corresponding THAT pattern exists, and a THAT string exists
-            if PatternTokens.DELIM_THAT in self.index and\
+            if branches.that is not None and\
                     len(context.that_history) != 0 and\
                     len(context.that_history[-1]) != 0:
-                that: str = context.that_history[-1][-1]\
-                    .lower()\
-                    .translate(str.maketrans('', '', string.punctuation))
-                that_words: List[str] = re.split('\\s+', that)
-                that_match: Optional[PatternMatch] =\
-                    self.index[PatternTokens.DELIM_THAT].match(that_words, context)
-                if that_match is not None:
-                    return that_match.as_that()
+                that_words: Tuple[str, ...] = _clause_words(context.that_history[-1][-1])
+                if len(that_words) >= branches.that.min_words:
+                    return _MatchFrame(branches.that, that_words, 0, _ENTERED_THAT)
+        if step == _TRY_TOPIC:
+            step = frame.step = _TRY_TERMINAL
             # A corresponding TOPIC pattern exists, and a TOPIC string exists
-            if PatternTokens.DELIM_TOPIC in self.index and\
+            if branches.topic is not None and\
                     'topic' in context.user_vars:
-                topic: str = context.user_vars['topic']\
-                    .lower()\
-                    .translate(str.maketrans('', '', string.punctuation))
-                topic_words: List[str] = re.split('\\s+', topic)
-                topic_match: Optional[PatternMatch] =\
-                    self.index[PatternTokens.DELIM_TOPIC].match(topic_words, context)
-                if topic_match is not None:
-                    return topic_match.as_topic()
-            # A pattern exists that ends here. sentence is already empty so stars will be none
-            if self.terminal is not None:
-                return PatternMatch(self.terminal)
-            return None
+                topic_words: Tuple[str, ...] = _clause_words(context.user_vars['topic'])
+                if len(topic_words) >= branches.topic.min_words:
+                    return _MatchFrame(branches.topic, topic_words, 0, _ENTERED_TOPIC)
+        if step == _TRY_TERMINAL:
+            # A pattern exists that ends here. There are no words left so stars will be none
+            frame.step = _EXHAUSTED
+            return _MATCHED if self.terminal is not None else None
+        
         # Go through each match type, if present, in order of priority
-        if PatternTokens.PRIORITY in self.index:
-            match: Optional[PatternMatch] =\
-                self.index[PatternTokens.PRIORITY].match(sentence, context)
-            if match is not None:
-                return match
+        remaining: int = len(words) - pos
+        if step == _TRY_PRIORITY:
+            step = frame.step = _TRY_HIGH_STAR
+            if branches.priority is not None and remaining >= branches.priority.min_words:
+                return _MatchFrame(branches.priority, words, pos)
         
         # Underscore and octothorpe do the same thing, just a matter of whether they require
-        # skipping ahead by one word before we start
-        star_index: int = -1
-        # Octothorpe takes priority, I think
-        if PatternTokens.OCTOTHORPE in self.index:
-            star_index = 0
-            next_pattern: 'PatternTree' = self.index[PatternTokens.OCTOTHORPE]
-        elif PatternTokens.UNDERSCORE in self.index:
-            star_index = 1
-            next_pattern = self.index[PatternTokens.UNDERSCORE]
-        if star_index != -1:
-            for i in range(star_index, len(sentence) + 1):
-                star_match: PatternMatch = next_pattern.match(sentence[i:], context)
-                if star_match != None:
+        # skipping ahead by one word before we start. Octothorpe takes priority
+        if step == _TRY_HIGH_STAR:
+            if branches.high_star is not None:
+                if frame.cursor is None:
+                    frame.cursor = pos + branches.high_star_skip
+                star_end: int = frame.cursor
+                # Leave at least as many words as the rest of the pattern needs
+                if star_end <= len(words) - branches.high_star.min_words:
+                    frame.cursor = star_end + 1
                     # Here I join on space since these are tokens that have already
                     # been split on whitespace
-                    new_star = ' '.join(sentence[:i])
-                    star_match.stars.insert(0, new_star)
-                    return star_match
-                    
+                    return _MatchFrame(branches.high_star, words, star_end,\
+                        ' '.join(words[pos:star_end]))
+                frame.cursor = None
+            step = frame.step = _TRY_BOT_VAR
+        
         # If we are looking for a bot variable
-        if PatternTokens.BOT_VAR in self.index:
-            word: str = sentence[0].lower().translate(str.maketrans('', '', string.punctuation))
-            for key, next_pattern in self.index[PatternTokens.BOT_VAR].index:
-                if context.get_bot(key)\
-                        .lower()\
-                        .translate(str.maketrans('', '', string.punctuation)) == word:
-                    bot_match: Optional[PatternMatch] =\
-                        self.index[key].match(sentence[1:], context)
-                    if bot_match != None:
-                        bot_match.stars.insert(0, sentence[0])
-                        return bot_match
+        if step == _TRY_BOT_VAR:
+            if branches.bot_var is not None:
+                word: str = _normalize(words[pos])
+                if frame.cursor is None:
+                    frame.cursor = iter(branches.bot_var.index.items())
+                for key, next_pattern in frame.cursor:
+                    if _normalize(context.get_bot(key.literal_value)) == word and\
+                            remaining - 1 >= next_pattern.min_words:
+                        return _MatchFrame(next_pattern, words, pos + 1, words[pos])
+                frame.cursor = None
+            step = frame.step = _TRY_GET_VAR
         # If we are looking for a user variable
-        if PatternTokens.GET_VAR in self.index:
-            word: str = sentence[0].lower().translate(str.maketrans('', '', string.punctuation))
-            for key, next_pattern in self.index[PatternTokens.GET_VAR].index:
-                if context.get_var(key)\
-                        .lower().\
-                        translate(str.maketrans('', '', string.punctuation)) == word:
-                    var_match: Optional[PatternMatch] =\
-                        self.index[key].match(sentence[1:], context)
-                    if var_match != None:
-                        var_match.stars.insert(0, sentence[0])
-                        return var_match
+        if step == _TRY_GET_VAR:
+            if branches.get_var is not None:
+                word: str = _normalize(words[pos])
+                if frame.cursor is None:
+                    frame.cursor = iter(branches.get_var.index.items())
+                for key, next_pattern in frame.cursor:
+                    if _normalize(context.get_var(key.literal_value)) == word and\
+                            remaining - 1 >= next_pattern.min_words:
+                        return _MatchFrame(next_pattern, words, pos + 1, words[pos])
+                frame.cursor = None
+            step = frame.step = _TRY_LITERAL
         
         # Default priority literal word
-        literal: PatternToken = PatternToken(literal_value = sentence[0])
-        if literal in self.index:
-            lit_match: PatternMatch = self.index[literal].match(sentence[1:], context)
-            if lit_match is not None:
-                return lit_match
+        if step == _TRY_LITERAL:
+            step = frame.step = _TRY_SET_MAP
+            literal: Optional[PatternTree] = self.literals.get(words[pos].lower())
+            if literal is not None and remaining - 1 >= literal.min_words:
+                return _MatchFrame(literal, words, pos + 1)
         
         # Next is matching a set
-        if PatternTokens.SET_MAP in self.index:
-            set_item: PatternTree = self.index[PatternTokens.SET_MAP]
-            word: str = sentence[0].lower()
-            for key, next_pattern in set_item.index.items():
-                if context.get_in_set(key.literal_value, word):
-                    set_match: Optional[PatternMatch] =\
-                        next_pattern.match(sentence[1:], context)
-                    if set_match is not None:
-                        set_match.stars.insert(0, sentence[0])
-                        return set_match
+        if step == _TRY_SET_MAP:
+            if branches.set_map is not None:
+                word: str = words[pos].lower()
+                if frame.cursor is None:
+                    frame.cursor = iter(branches.set_map.index.items())
+                for key, next_pattern in frame.cursor:
+                    if context.get_in_set(key.literal_value, word) and\
+                            remaining - 1 >= next_pattern.min_words:
+                        return _MatchFrame(next_pattern, words, pos + 1, words[pos])
+                frame.cursor = None
+            step = frame.step = _TRY_LOW_STAR
         
         # Carat and asterisk do the same thing, just a matter of whether they require
-        # skipping ahead by one word before we start
-        star_index: int = -1
-        # Carat takes priority, I think
-        if PatternTokens.CARAT in self.index:
-            star_index = 0
-            next_pattern: 'PatternTree' = self.index[PatternTokens.CARAT]
-        elif PatternTokens.ASTERISK in self.index:
-            star_index = 1
-            next_pattern = self.index[PatternTokens.ASTERISK]
-        if star_index != -1:
-            for i in range(star_index, len(sentence) + 1):
-                star_match: PatternMatch = next_pattern.match(sentence[i:], context)
-                if star_match != None:
+        # skipping ahead by one word before we start. Carat takes priority
+        if step == _TRY_LOW_STAR:
+            if branches.low_star is not None:
+                if frame.cursor is None:
+                    frame.cursor = pos + branches.low_star_skip
+                star_end: int = frame.cursor
+                if star_end <= len(words) - branches.low_star.min_words:
+                    frame.cursor = star_end + 1
                     # See above for comment on joining on space
-                    new_star = ' '.join(sentence[:i])
-                    star_match.stars.insert(0, new_star)
-                    return star_match
+                    return _MatchFrame(branches.low_star, words, star_end,\
+                        ' '.join(words[pos:star_end]))
+            frame.step = _EXHAUSTED
         
         # None matched
         return None
     
+    @staticmethod
+    def collect_match(stack: List['_MatchFrame']) -> PatternMatch:
+        """Build the match for a search that ended at the top of stack, gathering the stars
+        matched on the way down from the leaf up. Stars found under a THAT or TOPIC clause
+        become that_stars or topic_stars, as PatternMatch.as_that and .as_topic do"""
+        stars: List[str] = []
+        that_stars: List[str] = []
+        topic_stars: List[str] = []
+        for frame in reversed(stack):
+            entered: object = frame.entered
+            if entered is None:
+                continue
+            if entered is _ENTERED_THAT:
+                if stars:
+                    stars.reverse()
+                    that_stars = stars
+                    stars = []
+            elif entered is _ENTERED_TOPIC:
+                if stars:
+                    stars.reverse()
+                    topic_stars = stars
+                    stars = []
+            else:
+                stars.append(entered)
+        stars.reverse()
+        return PatternMatch(stack[-1].node.terminal, stars, that_stars, topic_stars)
+    
+    def dump(self, file: str, header: Any = None) -> None:
+        """Pickle this tree to a file, preceded by a header describing what it was built from.
+        The header is written as the repr of header, so it can be checked without unpickling"""
+        header_bytes: bytes = repr(header).encode()
+        with open(file, 'wb') as dst:
+            dst.write(_DUMP_MAGIC)
+            dst.write(len(header_bytes).to_bytes(4, 'little'))
+            dst.write(header_bytes)
+            pickle.dump(self, dst, pickle.HIGHEST_PROTOCOL)
+    
+    @staticmethod
+    def load(file: str, header: Any = None) -> Optional['PatternTree']:
+        """Unpickle a tree written by .dump(), or return None if the file was not written
+        by .dump() or the header it was written with differs from the one expected.
+        Nothing is unpickled until both are checked, but those checks only keep out stale
+        and unrelated files. Unpickling can run arbitrary code, so only load trusted files"""
+        header_bytes: bytes = repr(header).encode()
+        with open(file, 'rb') as src:
+            if src.read(len(_DUMP_MAGIC)) != _DUMP_MAGIC:
+                return None
+            if int.from_bytes(src.read(4), 'little') != len(header_bytes) or\
+                    src.read(len(header_bytes)) != header_bytes:
+                return None
+            return pickle.load(src)
+    
+    def invalidate(self) -> None:
+        """Mark this node as changed, so its bound is recalculated by the next .compile()"""
+        self.min_words = 0
+        self.compiled = False
+    
+    def compile(self) -> int:
+        """Calculate min_words for this node and every node below it that has changed since
+        it was last compiled, and return this node's min_words.
+        Matching can then skip wildcard lengths that leave too few words for the rest
+        of a pattern. Nodes are visited children first from a stack rather than recursively,
+        so long patterns cannot exhaust the recursion limit"""
+        # Each node is pushed once to queue its changed children, then again to be compiled
+        # once they are
+        stack: List[Tuple[PatternTree, bool]] = [(self, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if node.compiled:
+                continue
+            if children_done:
+                node.compile_node()
+                continue
+            stack.append((node, True))
+            for child in node.index.values():
+                if not child.compiled:
+                    stack.append((child, False))
+        return self.min_words
+    
+    def compile_node(self) -> None:
+        """Calculate min_words and the match lookups for this node alone,
+        once every node below it is compiled"""
+        # Reaching a terminal, or a THAT or TOPIC clause, needs no more input words
+        fewest: Optional[int] = 0 if self.terminal is not None else None
+        for token, child in self.index.items():
+            child_words: int = child.min_words
+            if token.wildcard_type in _DELIMITERS:
+                child_words = 0
+            elif token.wildcard_type in _CONSUMES_WORD:
+                child_words += 1
+            if fewest is None or child_words < fewest:
+                fewest = child_words
+        self.min_words = fewest or 0
+        self.branches = _Branches.of(self.index)
+        self.literals = {token.lowered: child\
+            for token, child in self.index.items()\
+            if token.wildcard_type is WildcardType.LITERAL} or _NO_LITERALS
+        self.compiled = True
+        # Reaching a terminal, or a THAT or TOPIC clause, needs no more input words
+        fewest: Optional[int] = 0 if self.terminal is not None else None
+        for token, child in self.index.items():
+            child_words: int = child.compile()
+            if token.wildcard_type in _DELIMITERS:
+                child_words = 0
+            elif token.wildcard_type in _CONSUMES_WORD:
+                child_words += 1
+            if fewest is None or child_words < fewest:
+                fewest = child_words
+        self.min_words = fewest or 0
+        self.branches = _Branches.of(self.index)
+        self.literals = {token.lowered: child\
+            for token, child in self.index.items()\
+            if token.wildcard_type is WildcardType.LITERAL} or _NO_LITERALS
+        self.compiled = True
+        return self.min_words
+
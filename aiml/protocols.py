@@ -49,6 +49,9 @@ class ContextLike(Protocol):
     def get_star(self, index: int, star_type: str) -> str:
         raise NotImplementedError()
     
+    def get_star_by_type(self, index: int, star_type: 'StarType') -> str:
+        raise NotImplementedError()
+    
     def learn_strtoks(self, pattern: Iterable[str],\
             template: 'Translatable',\
             that: Optional[Iterable[str]] = None,\
@@ -57,4 +60,7 @@ class ContextLike(Protocol):
         raise NotImplementedError()
     
     def unlearn(self) -> None:
+        raise NotImplementedError()
+    
+    def mark_volatile(self) -> None:
         raise NotImplementedError()
\ No newline at end of file
@@ -0,0 +1,229 @@
+"""
+aiml/aiml/substitution.py
+c Yaakov Schectman 2022
+
+An Aho-Corasick automaton used to find every substitution key in a string in one pass,
+no matter how many keys a substitution has.
+Every scanner picks matches the same way Brain.get_substitution always has: the earliest
+match wins, and of the keys matching there, the one listed first in the substitution wins.
+If pyahocorasick is installed, its native automaton is used in place of the pure Python one.
+Otherwise, substitutions with up to a few hundred keys are scanned with a regex alternation
+instead, as the re module's C matcher is faster than the Python automaton at that size.
+If hyperscan is installed, a Brain can be configured to scan with a compiled hyperscan
+database instead, which does the same job in native code
+"""
+
+import re
+from typing import (
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union
+)
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+# Beyond this many keys, trying each alternative at every position makes a regex
+# slower than the automaton
+_REGEX_MAX_KEYS: int = 256
+
+def _first_matches(first: Dict[int, int],\
+        keys: List[str],\
+        replacements: Dict[str, str]) -> Iterator[Tuple[int, int, str]]:
+    """Given the index of the first listed key found starting at each position, yield
+    (start, end, replacement) for the earliest non-overlapping matches"""
+    cursor: int = 0
+    for start in sorted(first):
+        if start < cursor:
+            continue
+        key: str = keys[first[start]]
+        cursor = start + len(key)
+        yield start, cursor, replacements[key]
+
+class SubstitutionAutomaton:
+    """A trie of lowercased substitution keys with failure links.
+    Scanning text with it yields the earliest, non-overlapping matches"""
+    def __init__(self, substitutions: Dict[str, str]) -> None:
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # Lengths and indices of every key that ends at each state,
+        # including through failure links
+        self.ends: List[Tuple[Tuple[int, int], ...]] = [()]
+        self.keys: List[str] = []
+        self.replacements: Dict[str, str] = {}
+        for key, replacement in substitutions.items():
+            key = key.lower()
+            if not key or key in self.replacements:
+                continue
+            self.replacements[key] = replacement
+            state: int = 0
+            for char in key:
+                next_state: Optional[int] = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.ends.append(())
+                state = next_state
+            self.ends[state] = ((len(key), len(self.keys)),)
+            self.keys.append(key)
+        self.link()
+
+    def link(self) -> None:
+        """Calculate the failure links breadth-first, so each state's fallback
+        is already complete by the time its children need it"""
+        queue: List[int] = list(self.goto[0].values())
+        for state in queue:
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback: int = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target: int = self.goto[fallback].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                self.ends[child] += self.ends[self.fail[child]]
+
+    def scan(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """Return an iterator of (start, end, replacement) for each match in already
+        lowercased text. At each position the first listed key starting there wins,
+        and scanning resumes after the end of the chosen match"""
+        first: Dict[int, int] = {}
+        goto: List[Dict[str, int]] = self.goto
+        fail: List[int] = self.fail
+        ends: List[Tuple[Tuple[int, int], ...]] = self.ends
+        state: int = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, index in ends[state]:
+                start: int = end - length
+                if index < first.get(start, index + 1):
+                    first[start] = index
+        return _first_matches(first, self.keys, self.replacements)
+
+class HyperscanSubstitution:
+    """The same scan as SubstitutionAutomaton, backed by a hyperscan database.
+    Hyperscan reports byte offsets, so text that is not pure ASCII is handed to an
+    Aho-Corasick automaton instead"""
+    def __init__(self, substitutions: Dict[str, str]) -> None:
+        self.substitutions: Dict[str, str] = substitutions
+        self.keys: List[str] = []
+        self.replacements: Dict[str, str] = {}
+        for key, replacement in substitutions.items():
+            key = key.lower()
+            if not key:
+                continue
+            if key not in self.replacements:
+                self.keys.append(key)
+                self.replacements[key] = replacement
+        self.fallback: Optional[SubstitutionAutomaton] = None
+        self.database: Optional['hyperscan.Database'] = None
+        if self.keys:
+            # Every byte is escaped so no key can be read as regex syntax
+            expressions: List[bytes] = [''.join(f'\\x{byte:02x}' for byte in key.encode())\
+                .encode() for key in self.keys]
+            self.database = hyperscan.Database()
+            self.database.compile(expressions = expressions,\
+                ids = list(range(len(self.keys))),\
+                elements = len(self.keys),\
+                flags = [0] * len(self.keys))
+
+    def scan(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """Yield (start, end, replacement) for each match in already lowercased text"""
+        if self.database is None:
+            return
+        if not text.isascii():
+            if self.fallback is None:
+                self.fallback = SubstitutionAutomaton(self.substitutions)
+            yield from self.fallback.scan(text)
+            return
+        keys: List[str] = self.keys
+        first: Dict[int, int] = {}
+        def on_match(key_id: int, _start: int, end: int, _flags: int, _context: None) -> None:
+            # Keys are literals, so where a match starts follows from where it ends.
+            # Ids are the keys' indices, so the lowest id is the first listed key
+            start: int = end - len(keys[key_id])
+            if key_id < first.get(start, key_id + 1):
+                first[start] = key_id
+        self.database.scan(text.encode('ascii'), match_event_handler = on_match)
+        yield from _first_matches(first, keys, self.replacements)
+
+class RegexSubstitution:
+    """The same scan as SubstitutionAutomaton, using one regex of all the keys.
+    Alternatives are tried in order at each position, so listing the keys in their
+    original order makes the first listed key starting there win"""
+    def __init__(self, substitutions: Dict[str, str]) -> None:
+        self.replacements: Dict[str, str] = {}
+        for key, replacement in substitutions.items():
+            key = key.lower()
+            if key:
+                self.replacements.setdefault(key, replacement)
+        self.pattern: Optional[re.Pattern] = None
+        if self.replacements:
+            self.pattern = re.compile('|'.join(map(re.escape, self.replacements)))
+
+    def scan(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """Yield (start, end, replacement) for each match in already lowercased text"""
+        if self.pattern is None:
+            return
+        replacements: Dict[str, str] = self.replacements
+        for match in self.pattern.finditer(text):
+            yield match.start(), match.end(), replacements[match.group()]
+
+class NativeSubstitutionAutomaton:
+    """The same scan as SubstitutionAutomaton, backed by pyahocorasick"""
+    def __init__(self, substitutions: Dict[str, str]) -> None:
+        self.keys: List[str] = []
+        self.replacements: Dict[str, str] = {}
+        self.automaton: 'ahocorasick.Automaton' = ahocorasick.Automaton()
+        for key, replacement in substitutions.items():
+            key = key.lower()
+            if not key or key in self.replacements:
+                continue
+            self.replacements[key] = replacement
+            self.automaton.add_word(key, (len(key), len(self.keys)))
+            self.keys.append(key)
+        if self.replacements:
+            self.automaton.make_automaton()
+
+    def scan(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """Return an iterator of (start, end, replacement) for each match in already
+        lowercased text"""
+        first: Dict[int, int] = {}
+        if self.replacements:
+            # pyahocorasick reports the index of the last character of each match
+            for last, (length, index) in self.automaton.iter(text):
+                start: int = last + 1 - length
+                if index < first.get(start, index + 1):
+                    first[start] = index
+        return _first_matches(first, self.keys, self.replacements)
+
+def build_scanner(substitutions: Dict[str, str], use_hyperscan: bool = False)\
+        -> 'SubstitutionScanner':
+    """Build the scanner for a substitution, using hyperscan only if it is requested
+    and installed, then pyahocorasick if it is installed, then a regex if there are
+    few enough keys"""
+    if use_hyperscan and hyperscan is not None:
+        return HyperscanSubstitution(substitutions)
+    if ahocorasick is not None:
+        return NativeSubstitutionAutomaton(substitutions)
+    if len(substitutions) <= _REGEX_MAX_KEYS:
+        return RegexSubstitution(substitutions)
+    return SubstitutionAutomaton(substitutions)
+
+SubstitutionScanner = Union[SubstitutionAutomaton,\
+    HyperscanSubstitution,\
+    RegexSubstitution,\
+    NativeSubstitutionAutomaton]
@@ -8,18 +8,24 @@ performed, and the output is returned.
 """
 
 import copy
+import functools
 import random
 import string
+import sys
 import xml.etree.ElementTree as ET
 from abc import ABC
+from enum import IntEnum
 from dataclasses import (
     dataclass,
-    field
+    field,
+    fields
 )
 from typing import (
     Callable,
+    ClassVar,
     Dict,
     Iterable,
+    Iterator,
     List,
     Optional,
     Sequence,
@@ -29,21 +35,144 @@ from typing import (
 
 from .protocols import ContextLike
 
+# Templates are built for every category, so they use __slots__ where dataclasses support it
+_slots: Dict[str, bool] = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+_PUNCT_TABLE: Dict[int, None] = str.maketrans('', '', string.punctuation)
+_getrandbits: Callable[[int], int] = random.getrandbits
+
+@functools.lru_cache(maxsize = 4096)
+def _norm(text: str) -> str:
+    """Normalize a predicate value for comparison in a <condition>.
+    Arms compare the same few short values over and over, so results are cached, and
+    punctuation is removed before lowercasing so there is less left to lowercase"""
+    return text.strip().translate(_PUNCT_TABLE).lower()
+
+def _subtrees(value: object) -> Iterator['Translatable']:
+    """Yield the Translatables held in a field, directly or inside tuples"""
+    if isinstance(value, Translatable):
+        yield value
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            yield from _subtrees(item)
+
+def _clone(value: object) -> object:
+    """Clone the Translatables held in a field, rebuilding any tuples they are inside"""
+    if isinstance(value, Translatable):
+        return value.clone()
+    if isinstance(value, (tuple, list)):
+        return type(value)(map(_clone, value))
+    return value
+
+def _replace(value: object, values: Dict[int, 'Translatable']) -> object:
+    """A field with each Translatable in values replaced by its value, or the field itself
+    if none of them are in it"""
+    if isinstance(value, Translatable):
+        return values.get(id(value), value)
+    if isinstance(value, (tuple, list)):
+        items: List[object] = [_replace(item, values) for item in value]
+        if any(new is not old for new, old in zip(items, value)):
+            return type(value)(items)
+    return value
+
+def _eval_closure(root: 'Translatable', context: ContextLike) -> None:
+    """Replace every <eval> below root with a TranslatableWord of its value.
+    The tree is walked depth first from an explicit stack, so each <eval> is evaluated in
+    the same order as in the template. Their parents are then rebuilt once the walk is done"""
+    values: Dict[int, Translatable] = {}
+    parents: List[Translatable] = []
+    stack: List[Translatable] = [root]
+    while stack:
+        node: Translatable = stack.pop()
+        if node.BIND_CLOSURE and node is not root:
+            values[id(node)] = TranslatableWord(node.translate(context))
+            continue
+        # Nothing inside an <eval> is bound, and a nested <learn> binds its own when it runs
+        if node.BIND_CLOSURE or isinstance(node, TranslatableLearn):
+            continue
+        children: List[Translatable] = [child\
+            for attr in fields(node)\
+            for child in _subtrees(getattr(node, attr.name))]
+        if children:
+            parents.append(node)
+            children.reverse()
+            stack.extend(children)
+    if not values:
+        return
+    for parent in parents:
+        changed: bool = False
+        for attr in fields(parent):
+            value: object = getattr(parent, attr.name)
+            replaced: object = _replace(value, values)
+            if replaced is not value:
+                setattr(parent, attr.name, replaced)
+                changed = True
+        if changed:
+            parent.refresh()
+
+def _append_words(tree: ET.Element, words: List[str]) -> None:
+    """Add a run of literals to the end of tree's text, or of its last child's tail.
+    Literals in the text are joined directly, and those in a tail by spaces"""
+    if len(tree) == 0:
+        tree.text = (tree.text or '') + ''.join(words)
+    else:
+        last: ET.Element = tree[-1]
+        if last.tail is not None:
+            words = [last.tail] + words
+        last.tail = ' '.join(words)
+
+def _append_sequence(tree: ET.Element, exprs: Iterable['Translatable']) -> None:
+    """Append each Translatable to tree, collecting consecutive TranslatableWords so their
+    text is joined once instead of being copied again for each word"""
+    words: List[str] = []
+    for expr in exprs:
+        if type(expr) is TranslatableWord:
+            words.append(expr.word)
+            continue
+        if words:
+            _append_words(tree, words)
+            words = []
+        expr.append_to(tree)
+    if words:
+        _append_words(tree, words)
+
 #==========Abstract base class out of which all Translatables are derived==========
 
 class Translatable(ABC):
     """
     Anything that can be translated to a text value
     """
+    __slots__ = ()
+    # True for binds in closures, i.e. <eval>
+    BIND_CLOSURE: ClassVar[bool] = False
+    
     def translate(self, context: ContextLike) -> str:
         raise NotImplementedError()
     
-    def bind_closure(self) -> bool:
-        """Override to return True for binds in closures, i.e. <eval>"""
-        False
-    
     def eval_closure(self, context: ContextLike) -> None:
-        """Recursivley go through each child and replace <eval>s with their value"""
+        """Go through each child and replace <eval>s with their value"""
+        _eval_closure(self, context)
+    
+    def contains_eval(self) -> bool:
+        """Whether eval_closure would replace anything in this Translatable"""
+        return any(child.contains_eval()\
+            for attr in fields(self)\
+            for child in _subtrees(getattr(self, attr.name)))
+    
+    def clone(self) -> 'Translatable':
+        """A copy that eval_closure can modify without changing this Translatable.
+        Subtrees without an <eval> are never modified, so they are shared rather than copied"""
+        if not self.contains_eval():
+            return self
+        copied: Translatable = copy.copy(self)
+        for attr in fields(self):
+            if attr.init:
+                setattr(copied, attr.name, _clone(getattr(self, attr.name)))
+        copied.refresh()
+        return copied
+    
+    def refresh(self) -> None:
+        """Override to recalculate anything derived from the children once they are replaced"""
         pass
     
     def append_to(self, tree: ET.Element) -> None:
@@ -57,28 +186,20 @@ class Translatable(ABC):
 #==========Concrete Translatable classes===========================
 #==========Simple Translatables that require no recursion==========
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableWord(Translatable):
     """A simple literal"""
     word: str
+    def __post_init__(self) -> None:
+        self.word = sys.intern(self.word)
+    
     def translate(self, context: ContextLike) -> str:
         return self.word
         
     def append_to(self, tree: ET.Element) -> None:
-        if len(tree) == 0:
-            if not tree.text:
-                tree.text = self.word
-            else:
-                tree.text += self.word
-        else:
-            tail: str = tree[-1].tail
-            if tail is None:
-                tail = self.word
-            else:
-                tail = tail + ' ' + self.word
-            tree[-1].tail = tail
+        _append_words(tree, [self.word])
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableUnlearn(Translatable):
     """<unlearn />
     I made this one up. Resets the learned rules
@@ -90,7 +211,7 @@ class TranslatableUnlearn(Translatable):
     def append_to(self, tree: ET.Element) -> None:
         ET.SubElement(tree, 'unlearn')
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableNull(Translatable):
     """Literally an empty element"""
     def translate(self, context: ContextLike) -> str:
@@ -101,25 +222,29 @@ class TranslatableNull(Translatable):
 
 #==========Format/transform applications==========
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableStringop(Translatable):
     """<sentence | uppercase | lowercase | formal | explode>
     Performs a string operation"""
     inner: Translatable
     transform: str
+    # The function for transform, looked up once here rather than on every translate
+    operation: Callable[[str], str] = field(init = False, repr = False, compare = False)
+    def __post_init__(self) -> None:
+        self.transform = sys.intern(self.transform)
+        operation: Optional[Callable[[str], str]] = _stringops.get(self.transform.lower())
+        if operation is None:
+            raise ValueError(f'Unknown string operation <{self.transform}>')
+        self.operation = operation
+    
     def translate(self, context: ContextLike) -> str:
-        return _stringops[self.transform.lower()](self.inner.translate(context))
+        return self.operation(self.inner.translate(context))
     
-    def eval_closure(self, context: ContextLike) -> None:
-        self.inner.eval_closure(context)
-        if self.inner.bind_closure():
-            self.inner = TranslatableWord(self.inner.translate(context))
-        
     def append_to(self, tree: ET.Element) -> None:
         root: ET.Element = ET.SubElement(tree, self.transform)
         self.inner.append_to(root)
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableDate(Translatable):
     """<date locale="..." timezone="..."><format>date format</format></date>
     Returns the current date according to the provided format"""
@@ -130,11 +255,6 @@ class TranslatableDate(Translatable):
         format_str: str = self.dformat.translate(context)
         return context.get_date(format_str, self.locale, self.timezone)
     
-    def eval_closure(self, context: ContextLike) -> None:
-        self.dformat.eval_closure(context)
-        if self.dformat.bind_closure():
-            self.dformat = TranslatableWord(self.dformat.translate(context))
-        
     def append_to(self, tree: ET.Element) -> None:
         root: ET.Element = ET.SubElement(tree, 'date')
         if self.locale is not None:
@@ -144,21 +264,32 @@ class TranslatableDate(Translatable):
         name: ET.Element = ET.SubElement(root, 'format')
         self.dformat.append_to(name)
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableRandom(Translatable):
     """<random><li>output1</li><li>output2</li>...</random>
     Randomly selects one of the li elements to use as output"""
     children: Sequence[Translatable]
+    # Random bits drawn per attempt at picking a child
+    bits: int = field(init = False, repr = False, compare = False)
+    def __post_init__(self) -> None:
+        self.children = tuple(self.children)
+        self.refresh()
+    
+    def refresh(self) -> None:
+        self.bits = len(self.children).bit_length()
+    
     def translate(self, context: ContextLike) -> str:
-        child: Translatable = random.choice(self.children)
-        return child.translate(context)
+        context.mark_volatile()
+        # The same rejection sampling random.choice does, without its two extra calls.
+        # Drawing the same bits keeps seeded responses the same as they were with it
+        count: int = len(self.children)
+        if count == 0:
+            raise IndexError('Cannot choose from an empty <random>')
+        index: int = _getrandbits(self.bits)
+        while index >= count:
+            index = _getrandbits(self.bits)
+        return self.children[index].translate(context)
     
-    def eval_closure(self, context: ContextLike) -> None:
-        for i, child in enumerate(self.children):
-            child.eval_closure(context)
-            if child.bind_closure():
-                self.children[i] = TranslatableWord(child.translate(context))
-        
     def append_to(self, tree: ET.Element) -> None:
         root: ET.Element = ET.SubElement(tree, 'random')
         for child in self.children:
@@ -167,26 +298,53 @@ class TranslatableRandom(Translatable):
 
 #==========Variable replacement tags==========
 
-@dataclass
+class StarType(IntEnum):
+    """The kinds of star, numbered in the order a context can keep their lists in"""
+    STAR = 0
+    THATSTAR = 1
+    TOPICSTAR = 2
+    
+    @staticmethod
+    def of(star_type: str) -> 'StarType':
+        """The StarType for a tag name. Anything that is not <star> or <thatstar>
+        is taken to be a <topicstar>"""
+        return _STAR_TYPES.get(star_type.lower(), StarType.TOPICSTAR)
+
+_STAR_TYPES: Dict[str, StarType] = {
+    'star': StarType.STAR,
+    'thatstar': StarType.THATSTAR,
+    'topicstar': StarType.TOPICSTAR
+}
+
+@dataclass(**_slots)
 class TranslatableStar(Translatable):
     """<star | thatstar | topicstar>
     Replace with matching wildcard text in input"""
     index: int = 1
     star_type: str = 'star'
+    # star_type resolved once, so the context can pick its list of stars by index
+    star_kind: 'StarType' = field(init = False, repr = False, compare = False)
+    def __post_init__(self) -> None:
+        self.star_type = sys.intern(self.star_type)
+        self.star_kind = StarType.of(self.star_type)
+    
     def translate(self, context: ContextLike) -> str:
-        return context.get_star(self.index - 1, self.star_type)
+        return context.get_star_by_type(self.index - 1, self.star_kind)
         
     def append_to(self, tree: ET.Element) -> None:
         root: ET.Element = ET.SubElement(tree, self.star_type)
         if self.index != 1:
             root.attrib['index'] = str(self.index)
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableRepeat(Translatable):
     """<request | response | input index="n" />
     Get the n-th input sentence, full input request, or full response"""
     repeat_type: str
     index: int = 1
+    def __post_init__(self) -> None:
+        self.repeat_type = sys.intern(self.repeat_type)
+    
     def translate(self, context: ContextLike) -> str:
         return context.get_repeat(self.index, self.repeat_type)
         
@@ -195,7 +353,7 @@ class TranslatableRepeat(Translatable):
         if self.index != 1:
             root.attrib['index'] = str(self.index)
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableThat(Translatable):
     """<that index="m,n" />
     Substitutes with the n-th to last sentence in the m-th to last response"""
@@ -210,7 +368,7 @@ class TranslatableThat(Translatable):
 
 #==========Get variables/state==========
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableGet(Translatable):
     """<get><name>variable_name</name></get>
     Gets a variable"""
@@ -219,17 +377,12 @@ class TranslatableGet(Translatable):
         key: str = self.key_expr.translate(context)
         return context.get_var(key)
     
-    def eval_closure(self, context: ContextLike) -> None:
-        self.key_expr.eval_closure(context)
-        if self.key_expr.bind_closure():
-            self.key_expr = TranslatableWord(self.key_expr.translate(context))
-        
     def append_to(self, tree: ET.Element) -> None:
         root: ET.Element = ET.SubElement(tree, 'get')
         name: ET.Element = ET.SubElement(root, 'name')
         self.key_expr.append_to(name)
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableBot(Translatable):
     """<bot><name>variable_name</name></bot>
     Gets a bot variable"""
@@ -238,17 +391,12 @@ class TranslatableBot(Translatable):
         key: str = self.key_expr.translate(context)
         return context.get_bot(key)
     
-    def eval_closure(self, context: ContextLike) -> None:
-        self.key_expr.eval_closure(context)
-        if self.key_expr.bind_closure():
-            self.key_expr = TranslatableWord(self.key_expr.translate(context))
-        
     def append_to(self, tree: ET.Element) -> None:
         root: ET.Element = ET.SubElement(tree, 'bot')
         name: ET.Element = ET.SubElement(root, 'name')
         self.key_expr.append_to(name)
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableMap(Translatable):
     """<map><name>map name</name>lookup value</map>
     Gets the corresponding map value for provided map name and lookup"""
@@ -259,40 +407,30 @@ class TranslatableMap(Translatable):
         key_str: str = self.key_expr.translate(context)
         return context.get_map(map_str, key_str)
     
-    def eval_closure(self, context: ContextLike) -> None:
-        self.map_expr.eval_closure(context)
-        if self.map_expr.bind_closure():
-            self.map_expr = TranslatableWord(self.map_expr.translate(context))
-        self.key_expr.eval_closure(context)
-        if self.key_expr.bind_closure():
-            self.key_expr = TranslatableWord(self.key_expr.translate(context))
-        
     def append_to(self, tree: ET.Element) -> None:
         root: ET.Element = ET.SubElement(tree, 'map')
         name: ET.Element = ET.SubElement(root, 'name')
         self.map_expr.append_to(name)
         self.key_expr.append_to(root)
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableSubst(Translatable):
     """<person | person2 | normalize | denormalize | gender >
     Performs word-by-word substitution in the provided substitution type"""
     subst_type: str
     expr: Translatable
+    def __post_init__(self) -> None:
+        self.subst_type = sys.intern(self.subst_type)
+    
     def translate(self, context: ContextLike) -> str:
         expr_str: str = self.expr.translate(context)
         return context.get_substitution(self.subst_type, expr_str)
     
-    def eval_closure(self, context: ContextLike) -> None:
-        self.expr.eval_closure(context)
-        if self.expr.bind_closure():
-            self.expr = TranslatableWord(self.expr.translate(context))
-        
     def append_to(self, tree: ET.Element) -> None:
         root: ET.Element = ET.SubElement(tree, self.subst_type)
         self.expr.append_to(root)
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableSet(Translatable):
     """<set><name>variable_name</name><value>set_value</value></set>
     Sets a variable to an evaluated value and returns the value"""
@@ -304,14 +442,6 @@ class TranslatableSet(Translatable):
         context.set_var(key, value)
         return value
     
-    def eval_closure(self, context: ContextLike) -> None:
-        self.key_expr.eval_closure(context)
-        if self.key_expr.bind_closure():
-            self.key_expr = TranslatableWord(self.key_expr.translate(context))
-        self.value_expr.eval_closure(context)
-        if self.value_expr.bind_closure():
-            self.value_expr = TranslatableWord(self.value_expr.translate(context))
-        
     def append_to(self, tree: ET.Element) -> None:
         root: ET.Element = ET.SubElement(tree, 'set')
         name: ET.Element = ET.SubElement(root, 'name')
@@ -320,31 +450,32 @@ class TranslatableSet(Translatable):
 
 #==========Recursive Translatables==========
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableIterable(Translatable):
     """A translatable that contains a sequence of zero or more translatables
     The pieces are joined by the empty string because separating spaces will
     end up included in the literal segments"""
-    elements: Iterable[Translatable] = field(default_factory = list)
+    elements: Iterable[Translatable] = field(default_factory = tuple)
+    # Each element's bound translate method, so translating skips looking them up
+    translates: Tuple[Callable[[ContextLike], str], ...] =\
+        field(init = False, repr = False, compare = False)
+    def __post_init__(self) -> None:
+        self.elements = tuple(self.elements)
+        self.refresh()
+    
+    def refresh(self) -> None:
+        self.translates = tuple([element.translate for element in self.elements])
+    
     def translate(self, context: ContextLike) -> str:
-        return ''\
-            .join(\
-                filter(\
-                    lambda y: y != '',\
-                    map(\
-                        lambda x: x.translate(context), self.elements)))
+        # Every template with more than one part is translated through here, so the
+        # parts are joined straight from a list rather than through lambdas.
+        # Empty parts add nothing to the join, so they need no filtering
+        return ''.join([translate(context) for translate in self.translates])
     
-    def eval_closure(self, context: ContextLike) -> None:
-        for i, element in enumerate(self.elements):
-            element.eval_closure(context)
-            if element.bind_closure():
-                self.elements[i] = TranslatableWord(element.translate(context))
-        
     def append_to(self, tree: ET.Element) -> None:
-        for child in self.elements:
-            child.append_to(tree)
+        _append_sequence(tree, self.elements)
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableThink(Translatable):
     """<think>inner XML</think>
     A translatable that calls its inner XML when called, but returns nothing"""
@@ -354,16 +485,11 @@ class TranslatableThink(Translatable):
             self.child.translate(context)
         return ''
     
-    def eval_closure(self, context: ContextLike) -> None:
-        self.child.eval_closure(context)
-        if self.child.bind_closure():
-            self.child = TranslatableWord(self.child.translate(context))
-        
     def append_to(self, tree: ET.Element) -> None:
         root: ET.Element = ET.SubElement(tree, 'think')
         self.child.append_to(root)
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableSrai(Translatable):
     """<srai>expression</srai>
     Performs a subquery of sorts on the contained expression"""
@@ -372,52 +498,43 @@ class TranslatableSrai(Translatable):
         inner: str = self.inner_expr.translate(context)
         return context.get_srai(inner)
     
-    def eval_closure(self, context: ContextLike) -> None:
-        self.inner_expr.eval_closure(context)
-        if self.inner_expr.bind_closure():
-            self.inner_expr = TranslatableWord(self.inner_expr.translate(context))
-        
     def append_to(self, tree: ET.Element) -> None:
         root: ET.Element = ET.SubElement(tree, 'srai')
         self.inner_expr.append_to(root)
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableCondition(Translatable):
     """<condition><li><name>variable name</name><value>match</value>output</li>...</condition>
     Checks the value of a variable and chooses what to output by it
     Mapping is tuples of the form (name, value, expr, loop)"""
     mapping: Iterable[Tuple[Translatable, Translatable, Translatable, bool]]
     default: Optional[Tuple[Translatable, bool]] = None
+    # A <loop> that never stops used to exhaust the recursion limit; it still fails past this
+    max_loops: ClassVar[int] = 1000
+    def __post_init__(self) -> None:
+        self.mapping = tuple(map(tuple, self.mapping))
+    
     def translate(self, context: ContextLike) -> str:
-        for mapping in self.mapping:
-            name: str = mapping[0].translate(context)
-            value: str = context.get_var(name)
-            test: str = mapping[1].translate(context)
-            if value.strip().lower().translate(str.maketrans('', '', string.punctuation)) ==\
-                    test.strip().lower().translate(str.maketrans('', '', string.punctuation)):
-                result: str = mapping[2].translate(context)
-                if mapping[3]:
-                    result += ' ' + self.translate(context)
-                return result
-        if self.default is not None:
-            result: str = self.default[0].translate(context)
-            if self.default[1]:
-                result += ' ' + self.translate(context)
-            return result
-        return ''
+        # Looping arms restart the search from the top in this loop rather than by recursing,
+        # and the outputs of every pass are joined by spaces at the end
+        results: List[str] = []
+        for _ in range(self.max_loops):
+            loop: bool = False
+            for name_expr, test_expr, expr, loop in self.mapping:
+                value: str = context.get_var(name_expr.translate(context))
+                if _norm(value) == _norm(test_expr.translate(context)):
+                    results.append(expr.translate(context))
+                    break
+            else:
+                if self.default is None:
+                    results.append('')
+                    return ' '.join(results)
+                results.append(self.default[0].translate(context))
+                loop = self.default[1]
+            if not loop:
+                return ' '.join(results)
+        raise RecursionError(f'<condition> looped more than {self.max_loops} times')
     
-    def eval_closure(self, context: ContextLike) -> None:
-        for mapping in self.mapping:
-            for i in range(3):
-                mapping[i].eval_closure(context)
-                if mapping[i].bind_closure():
-                    mapping[i] = TranslatableWord(mapping[i].translate(context))
-        if self.default is not None:
-            self.default.eval_closure(context)
-            self.default.eval_closure(context)
-            if self.default.bind_closure():
-                self.default = TranslatableWord(self.default.translate(context))
-        
     def append_to(self, tree: ET.Element) -> None:
         root: ET.Element = ET.SubElement(tree, 'condition')
         for mapping in self.mapping:
@@ -435,22 +552,23 @@ class TranslatableCondition(Translatable):
             if self.default[1]:
                 ET.SubElement(li, 'loop')
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableEval(Translatable):
     """<eval>expr</eval>
     Evaluates the inner expression. Only used in learn elements"""
+    BIND_CLOSURE: ClassVar[bool] = True
     child: Translatable
     def translate(self, context: ContextLike) -> str:
         return self.child.translate(context)
     
-    def bind_closure(self) -> bool:
+    def contains_eval(self) -> bool:
         return True
         
     def append_to(self, tree: ET.Element) -> None:
         root: ET.Element = ET.SubElement(tree, 'eval')
         self.child.append_to(root)
 
-@dataclass
+@dataclass(**_slots)
 class TranslatableLearn(Translatable):
     """<learn>
     <category>
@@ -467,18 +585,45 @@ class TranslatableLearn(Translatable):
     template_exprs: Translatable
     that_exprs: Optional[Iterable[Union[TranslatableWord, TranslatableEval]]] = None
     topic_exprs: Optional[Iterable[Union[TranslatableWord, TranslatableEval]]] = None
+    # Whether the template has <eval>s, and so must be copied before they are bound
+    template_has_eval: bool = field(init = False, repr = False, compare = False)
+    # The text of the pattern, THAT, and TOPIC when they have no <eval>s, else None
+    pattern_words: Optional[Tuple[str, ...]] = field(init = False, repr = False, compare = False)
+    that_words: Optional[Tuple[str, ...]] = field(init = False, repr = False, compare = False)
+    topic_words: Optional[Tuple[str, ...]] = field(init = False, repr = False, compare = False)
+    def __post_init__(self) -> None:
+        self.pattern_exprs = tuple(self.pattern_exprs)
+        if self.that_exprs is not None:
+            self.that_exprs = tuple(self.that_exprs)
+        if self.topic_exprs is not None:
+            self.topic_exprs = tuple(self.topic_exprs)
+        self.refresh()
+    
+    def refresh(self) -> None:
+        self.template_has_eval = self.template_exprs.contains_eval()
+        self.pattern_words = _constants(self.pattern_exprs)
+        self.that_words = _constants(self.that_exprs)
+        self.topic_words = _constants(self.topic_exprs)
+    
+    def contains_eval(self) -> bool:
+        # A nested <learn> binds its own <eval>s when it is triggered
+        return False
+    
     def translate(self, context: ContextLike) -> str:
-        pattern: Iterable[str] = map(lambda x: x.translate(context), self.pattern_exprs)
-        that: Optional[Iterable[str]] =\
-            map(lambda x: x.translate(context), self.topic_exprs) if\
-            self.that_exprs is not None else\
-            None
-        topic: Optional[Iterable[str]] =\
-            map(lambda x: x.translate(context), self.topic_exprs) if\
-            self.topic_exprs is not None else\
-            None
-        template: Translatable = copy.deepcopy(self.template_exprs)
-        template.eval_closure(context)
+        # <eval>s are translated lazily, as the context consumes them after the template
+        pattern: Iterable[str] = self.pattern_words if self.pattern_words is not None else\
+            (expr.translate(context) for expr in self.pattern_exprs)
+        that: Optional[Iterable[str]] = self.that_words\
+            if self.that_words is not None or self.that_exprs is None else\
+            (expr.translate(context) for expr in self.that_exprs)
+        topic: Optional[Iterable[str]] = self.topic_words\
+            if self.topic_words is not None or self.topic_exprs is None else\
+            (expr.translate(context) for expr in self.topic_exprs)
+        # A template without <eval>s is never modified, so the learned category can share it
+        template: Translatable = self.template_exprs
+        if self.template_has_eval:
+            template = template.clone()
+            template.eval_closure(context)
         context.learn_strtoks(pattern, template, that, topic, True)
         return ''
         
@@ -486,16 +631,13 @@ class TranslatableLearn(Translatable):
         root: ET.Element = ET.SubElement(tree, 'learn')
         root = ET.SubElement(root, 'category')
         pattern: ET.Element = ET.SubElement(root, 'pattern')
-        for expr in self.pattern_exprs:
-            expr.append_to(pattern)
+        _append_sequence(pattern, self.pattern_exprs)
         if self.that_exprs is not None:
             that: ET.Element = ET.SubElement(root, 'that')
-            for expr in self.that_exprs:
-                expr.append_to(that)
+            _append_sequence(that, self.that_exprs)
         if self.topic_exprs is not None:
             topic: ET.Element = ET.SubElement(root, 'topic')
-            for expr in self.topic_exprs:
-                expr.append_to(topic)
+            _append_sequence(topic, self.topic_exprs)
         template: ET.Element = ET.SubElement(root, 'template')
         self.template_exprs.append_to(template)
 
@@ -506,10 +648,61 @@ LearnedCategory: type = Tuple[Iterable[Union[TranslatableWord, TranslatableEval]
     Optional[Iterable[Union[TranslatableWord, TranslatableEval]]],\
     Optional[Iterable[Union[TranslatableWord, TranslatableEval]]]]
 
+#==========Shared instances==========
+
+@functools.lru_cache(maxsize = 65536)
+def translatable_word(word: str) -> TranslatableWord:
+    """Get a TranslatableWord for a literal, shared with every other template that has
+    the same literal. Words are never modified in place, so sharing them is safe"""
+    return TranslatableWord(word)
+
+#==========Constant folding==========
+
+def _constant(node: Translatable) -> Optional[str]:
+    """The output of node if it is the same in every context, otherwise None"""
+    node_type: type = type(node)
+    if node_type is TranslatableWord:
+        return node.word
+    if node_type is TranslatableNull:
+        return ''
+    return None
+
+def _constants(exprs: Optional[Iterable[Translatable]]) -> Optional[Tuple[str, ...]]:
+    """The outputs of exprs if none of them depend on the context, otherwise None"""
+    if exprs is None:
+        return None
+    parts: List[Optional[str]] = [_constant(expr) for expr in exprs]
+    return None if None in parts else tuple(parts)
+
+def _fold(node: Translatable) -> Translatable:
+    """Replace a string operation, sequence, or random choice whose output can't depend on
+    the context with a TranslatableWord of that output. Only node itself is checked,
+    as the parser builds templates bottom up and folds each child before its parent"""
+    if isinstance(node, TranslatableStringop):
+        inner: Optional[str] = _constant(node.inner)
+        if inner is not None:
+            return translatable_word(node.operation(inner))
+    elif isinstance(node, TranslatableIterable):
+        parts: List[Optional[str]] = [_constant(element) for element in node.elements]
+        if None not in parts:
+            return translatable_word(''.join(parts))
+    elif isinstance(node, TranslatableRandom) and node.children:
+        # Choosing between identical outputs is not random, so it need not mark the
+        # response volatile either
+        first: Optional[str] = _constant(node.children[0])
+        if first is not None and all(_constant(child) == first for child in node.children):
+            return node.children[0]
+    return node
+
 #==========Internal-use stringop mappings==========
 
+def _explode(text: str) -> str:
+    """Space out every character of text"""
+    return ' '.join(list(text))
+
+# Plain functions rather than lambdas, so the TranslatableStringops holding them can be pickled
 _stringops: Dict[str, Callable[[str], str]] = {
-    'explode': lambda x: ' '.join(list(x)),
+    'explode': _explode,
     'uppercase': str.upper,
     'lowercase': str.lower,
     'formal': str.title,
@@ -1,10 +1,25 @@
 from distutils.core import setup
 
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    cythonize = None
+
+# The pattern matching, substitution, bag of words, AIML parsing, and template rendering hot paths
+# are plain Python modules that Cython can compile as they are. When it is installed they are built
+# as extension modules, which are imported in place of the .py files; otherwise nothing changes
+ext_modules = [] if cythonize is None else cythonize(
+    ['aiml/pattern.py', 'aiml/substitution.py', 'aiml/bow.py', 'aiml/parser.py',\
+        'aiml/translatable.py'],
+    compiler_directives = {'language_level': 3, 'annotation_typing': False}
+)
+
 setup(
     name='PyAiml2',
     description='Utility for AIML chatbot',
     author='Yaakov Schectman',
     author_email='yaakov.schectman@gmail.com',
     url='https://github.com/cppietime/PyAiml2',
-    packages=['aiml']
+    packages=['aiml'],
+    ext_modules=ext_modules
 )
\ No newline at end of file
@@ -0,0 +1,51 @@
+"""
+aiml/tests/cache_test.py
+"""
+
+from tests import get_config
+
+categories = '''<aiml>
+<category><pattern>WHAT IS MY NAME</pattern><template>Your name is <get name="name"/></template></category>
+<category><pattern>WHO AM I</pattern><template><srai>WHAT IS MY NAME</srai></template></category>
+<category><pattern>ROLL</pattern><template><random><li>One</li><li>Two</li></random></template></category>
+</aiml>'''
+
+def main():
+    brain = get_config.make_brain(categories)
+    brain.set_var('name', 'Alice')
+    # The last response is part of the key, so the first two requests both miss
+    assert(brain.process('What is my name') == 'Your name is Alice.')
+    assert(brain.process('What is my name') == 'Your name is Alice.')
+    assert(len(brain.response_cache) == 2)
+    # From then on, the repeated sentence is answered from the cache
+    version = brain.state_version
+    assert(brain.process('What is my name') == 'Your name is Alice.')
+    assert(len(brain.response_cache) == 2 and brain.state_version == version)
+    # Setting a predicate through the Brain invalidates it
+    brain.set_var('name', 'Bob')
+    assert(brain.process('What is my name') == 'Your name is Bob.')
+    assert(brain.process('What is my name') == 'Your name is Bob.')
+    # Changing a predicate directly is only noticed after invalidate_caches()
+    brain.user_vars['name'] = 'Carol'
+    assert(brain.process('What is my name') == 'Your name is Bob.')
+    brain.invalidate_caches()
+    assert(len(brain.response_cache) == 0)
+    assert(brain.process('What is my name') == 'Your name is Carol.')
+    # SRAI results are cached and invalidated the same way
+    brain.response_cache.clear()
+    assert(brain.process('Who am I') == 'Your name is Carol.')
+    assert(len(brain.srai_cache) == 1)
+    brain.response_cache.clear()
+    brain.user_vars['name'] = 'Dave'
+    assert(brain.process('Who am I') == 'Your name is Carol.')
+    brain.invalidate_caches()
+    assert(len(brain.srai_cache) == 0)
+    assert(brain.process('Who am I') == 'Your name is Dave.')
+    # Responses that may differ between identical requests are never cached
+    brain.response_cache.clear()
+    assert(brain.process('Roll') in ('One.', 'Two.'))
+    assert(len(brain.response_cache) == 0)
+    print('Passed')
+
+if __name__=='__main__':
+    main()
\ No newline at end of file
@@ -11,4 +11,22 @@ class BrainConfig:
 
 @dataclass
 class Brain(object):
-    config: BrainConfig = field(default_factory = lambda: None)
\ No newline at end of file
+    config: BrainConfig = field(default_factory = lambda: None)
+
+
+#==========Shared by the test scripts that need a real Brain==========
+
+from xml.etree import ElementTree as ET
+
+from aiml import brain as aiml_brain
+from aiml import config as aiml_config
+
+def make_brain(categories: str) -> aiml_brain.Brain:
+    """Make a Brain that loads no files, with the categories of an <aiml> string merged in"""
+    bc = aiml_config.BrainConfig(learn_file_path='', bot_file_path='',\
+        init_vars_file_path=None, bow_file_path='')
+    brain = aiml_brain.Brain(brain_config = bc)
+    for category in ET.fromstring(categories):
+        brain.pattern_tree.merge(brain.aiml_parser.parse_category(category))
+    brain.invalidate_caches()
+    return brain
@@ -0,0 +1,49 @@
+"""
+aiml/tests/parse_many_test.py
+"""
+
+import os
+import tempfile
+
+from aiml.brain import Brain
+from aiml.config import BrainConfig
+from aiml.parser import AimlParser
+from aiml.pattern import PatternTree
+
+sources = [
+    '''<aiml>
+<category><pattern>HELLO</pattern><template>Hi there</template></category>
+<category><pattern>REPEAT *</pattern><template><uppercase><star/></uppercase></template></category>
+</aiml>''',
+    '''<aiml>
+<topic name="FOOD"><category><pattern>EAT</pattern><template>Yum</template></category></topic>
+<category><pattern>HELLO</pattern><template>Hello again</template></category>
+</aiml>''',
+]
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i, source in enumerate(sources):
+            paths.append(os.path.join(directory, f'brain{i}.aiml'))
+            with open(paths[-1], 'w') as file:
+                file.write(source)
+        # The parser and its bound template handlers must survive being sent to the workers
+        parser = AimlParser(BrainConfig())
+        parallel = parser.parse_many(paths, 2)
+        serial = PatternTree()
+        for path in paths:
+            serial.merge(parser.parse(path))
+        assert(repr(parallel) == repr(serial))
+        bc = BrainConfig(brain_files=paths, parse_workers=2, learn_file_path='',\
+            bot_file_path='', init_vars_file_path=None, bow_file_path='')
+        brain = Brain(brain_config = bc)
+        # Later files override earlier ones, as when they are loaded one at a time
+        assert(brain.process('hello') == 'Hello again.')
+        assert(brain.process('repeat this') == 'THIS.')
+        brain.set_var('topic', 'food')
+        assert(brain.process('eat') == 'Yum.')
+    print('Passed')
+
+if __name__=='__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""
+aiml/tests/pattern_match_test.py
+"""
+
+from xml.etree import ElementTree as ET
+
+from tests import get_config
+
+categories = '''<aiml>
+<category><pattern>A *</pattern><template>asterisk <star/></template></category>
+<category><pattern>A WORLD</pattern><template>literal</template></category>
+<category><pattern>B _</pattern><template>underscore <star/></template></category>
+<category><pattern>B WORLD</pattern><template>literal</template></category>
+<category><pattern>C $WORLD</pattern><template>priority</template></category>
+<category><pattern>C _</pattern><template>underscore <star/></template></category>
+<category><pattern>D ^ END</pattern><template>carat</template></category>
+<category><pattern>D END</pattern><template>literal</template></category>
+<category><pattern>E # END</pattern><template>octothorpe</template></category>
+<category><pattern>E END</pattern><template>literal</template></category>
+<category><pattern>F <set name="color"/></pattern><template>set <star/></template></category>
+<category><pattern>F *</pattern><template>asterisk <star/></template></category>
+<category><pattern>G <bot name="name"/></pattern><template>bot <star/></template></category>
+<category><pattern>G *</pattern><template>asterisk <star/></template></category>
+<category><pattern>H <get name="pet"/></pattern><template>get <star/></template></category>
+<category><pattern>H *</pattern><template>asterisk <star/></template></category>
+<category><pattern>LONG * ONE TWO THREE</pattern><template>long <star/></template></category>
+<category><pattern>DEEP *</pattern><template>deep</template></category>
+<category><pattern>ASK</pattern><template>Do you like cheese</template></category>
+<category><pattern>YES</pattern><that>DO YOU LIKE *</that><template>that <thatstar/></template></category>
+<category><pattern>YES</pattern><template>plain</template></category>
+<category><pattern>EAT</pattern><topic>FOOD *</topic><template>topic <topicstar/></template></category>
+<category><pattern>EAT</pattern><template>plain</template></category>
+</aiml>'''
+
+def make_brain():
+    brain = get_config.make_brain(categories)
+    brain.sets['color'] = frozenset({'red'})
+    brain.bot_vars['name'] = 'alice'
+    brain.invalidate_caches()
+    return brain
+
+def respond(brain, sentence):
+    match = brain.pattern_tree.match(sentence.split(), brain)
+    if match is None:
+        return None
+    brain.stars, brain.that_stars, brain.topic_stars =\
+        match.stars, match.that_stars, match.topic_stars
+    return match.translatable.translate(brain)
+
+def main():
+    brain = make_brain()
+    # Literal words beat ^ and *
+    assert(respond(brain, 'a world') == 'literal')
+    assert(respond(brain, 'a big world') == 'asterisk big world')
+    assert(respond(brain, 'd end') == 'literal')
+    assert(respond(brain, 'd the end') == 'carat')
+    # $, #, and _ beat literal words
+    assert(respond(brain, 'b world') == 'underscore world')
+    assert(respond(brain, 'e end') == 'octothorpe')
+    assert(respond(brain, 'c world') == 'priority')
+    assert(respond(brain, 'c other') == 'underscore other')
+    # Sets, bot properties, and predicates
+    assert(respond(brain, 'f red') == 'set red')
+    assert(respond(brain, 'f blue') == 'asterisk blue')
+    assert(respond(brain, 'g alice') == 'bot alice')
+    assert(respond(brain, 'g bob') == 'asterisk bob')
+    assert(respond(brain, 'h rex') == 'asterisk rex')
+    brain.set_var('pet', 'rex')
+    assert(respond(brain, 'h rex') == 'get rex')
+    # Too few words for the rest of the pattern are pruned by min_words
+    assert(respond(brain, 'long one two three') is None)
+    assert(respond(brain, 'long x one two three') == 'long x')
+    assert(respond(brain, 'long x one two') is None)
+    # Long sentences and long patterns do not exhaust the recursion limit
+    assert(respond(brain, 'deep ' + 'word ' * 5000) == 'deep')
+    long_pattern = 'word ' * 5000
+    long_category = ET.fromstring(f'<category><pattern>{long_pattern}</pattern>'\
+        '<template>long pattern</template></category>')
+    brain.pattern_tree.merge(brain.aiml_parser.parse_category(long_category))
+    assert(respond(brain, long_pattern) == 'long pattern')
+    assert(respond(brain, 'a world') == 'literal')
+    # THAT and TOPIC clauses
+    assert(brain.process('yes') == 'plain.')
+    assert(brain.process('ask') == 'Do you like cheese.')
+    assert(brain.process('yes') == 'that cheese.')
+    assert(brain.process('eat') == 'plain.')
+    brain.set_var('topic', 'food pizza')
+    assert(brain.process('eat') == 'topic pizza.')
+    print('Passed')
+
+if __name__=='__main__':
+    main()
\ No newline at end of file
@@ -1,8 +1,12 @@
 """
 aiml/tests/response_test.py
 """
+import dataclasses
 import json
 import logging
+import os
+import pathlib
+import sys
 from xml.etree import ElementTree as ET
 
 from aiml.brain import Brain
@@ -10,24 +14,20 @@ from aiml.config import *
 from aiml.parser import AimlParser
 from aiml import bow
 
-source = """\
-<aiml>
-    <category>
-        <pattern>Last dance for mary jane</pattern>
-        <template>One more time to kill the pain</template>
-    </category>
-    <category>
-        <pattern><set name='testset'/> in my set</pattern>
-        <template><star/> is in that set</template>
-    </category>
-</aiml>
-"""
+# The AIML the REPL adds to the brain. Its parsed tree is cached beside it in
+# response_test.aimlc, and only parsed again once the cache is out of date
+source_path = pathlib.Path(__file__).with_suffix('.aiml')
 
 def callback(a, b, c):
     print(f'{a} has been updated from {b} to {c}')
 
 def main():
-    logging.basicConfig(level='DEBUG')
+    # Pass --debug for DEBUG output, otherwise AIML_LOGLEVEL sets the level
+    logging.basicConfig(level='DEBUG' if '--debug' in sys.argv else\
+        os.environ.get('AIML_LOGLEVEL', 'WARNING'))
+    # Records don't need the process or thread they came from
+    logging.logProcesses = False
+    logging.logThreads = False
     # with open('test_bow.json') as file:
         # d: Dict[str, List[str]] = json.load(file)
     # bags: Iterable[bow.Document] = map(lambda x: bow.Document(*x), d.items())
@@ -45,8 +45,8 @@ def main():
         init_vars_file_path='vars.json',
         bow_file_path='test_bow.json'
     )
-    parser = AimlParser(bc)
-    tree = parser.parse_string(source)
+    parser = AimlParser(dataclasses.replace(bc, cache_compiled = True))
+    tree = parser.parse(str(source_path))
     brain = Brain(brain_config = bc)
     brain.pattern_tree.merge(tree)
     brain.bind('outfit', callback)
@@ -54,11 +54,17 @@ def main():
     # brain.load_props()
     # brain.load_learnt_rules()
     try:
-        while True:
-            line = input('Say something: ')
-            output = brain.process(line)
-            print(output)
-    except KeyboardInterrupt:
+        if sys.stdin.isatty():
+            while True:
+                line = input('Say something: ')
+                output = brain.process(line)
+                print(output)
+        else:
+            # Piped input is read a buffer at a time and needs no prompts. Output to a pipe
+            # is already block buffered, so it is written in large chunks too
+            for line in sys.stdin:
+                print(brain.process(line.rstrip('\n')))
+    except (KeyboardInterrupt, EOFError):
         pass
     # brain.save_vars()
     # brain.save_learnt_rules()